@@ -1,7 +1,10 @@
 # %%
+import operator
+from typing import Annotated
 from langgraph.graph import MessagesState
 from  langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage, RemoveMessage
+from langchain_core.messages.utils import count_tokens_approximately
 from langgraph.graph import END
 from IPython.display import Image, display
 from langgraph.checkpoint.memory import MemorySaver
@@ -9,9 +12,32 @@ from langgraph.graph import StateGraph, START
 # %%
 llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite-preview-06-17")
 
+# %%
+# Summarize once the context passes the high watermark, keeping recent messages
+# up to the low watermark. Kept low so the short conversation below is summarized
+SUMMARY_HIGH_WATERMARK = 500
+SUMMARY_LOW_WATERMARK = 150
 # %%
 class State(MessagesState):
     summary: str
+    # Approximate tokens of the summary and messages, updated as they change
+    context_tokens: Annotated[int, operator.add]
+    # ID of the newest message counted in context_tokens
+    last_counted_id: str
+# %%
+def count_tokens(messages: list) -> int:
+    """Approximate token count, computed offline and additive across messages."""
+    return sum(count_tokens_approximately([message]) for message in messages)
+
+
+def uncounted_messages(state: State) -> list:
+    """Messages added since context_tokens was last updated."""
+    messages = state["messages"]
+    last_counted_id = state.get("last_counted_id")
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].id == last_counted_id:
+            return messages[i + 1 :]
+    return messages
 # %%
 # Define the logic to call the model
 def call_model(state: State):
@@ -30,7 +56,13 @@ def call_model(state: State):
         messages = state["messages"]
 
     response = llm.invoke(messages)
-    return {"messages": response}
+
+    # Add the new user messages and the response to the running token count
+    return {
+        "messages": response,
+        "context_tokens": count_tokens(uncounted_messages(state) + [response]),
+        "last_counted_id": response.id,
+    }
 # %%
 def summarize_conversation(state: State):
     # First, we get any existing summary
@@ -51,18 +83,32 @@ def summarize_conversation(state: State):
     messages = state["messages"] + [HumanMessage(content=summary_message)]
     response = llm.invoke(messages)
 
-    # Delete all but the 2 most recent messages
-    delete_messages = [RemoveMessage(id=m.id) for m in state["messages"][:-2]]
-    return {"summary": response.content, "messages": delete_messages}
+    # Keep the 2 most recent messages, plus older ones while they fit under the
+    # low watermark
+    kept, kept_tokens = 2, count_tokens(state["messages"][-2:])
+    for message in reversed(state["messages"][:-2]):
+        kept_tokens += count_tokens([message])
+        if kept_tokens > SUMMARY_LOW_WATERMARK:
+            break
+        kept += 1
+
+    # Delete the older messages
+    removed = state["messages"][:-kept]
+    delete_messages = [RemoveMessage(id=m.id) for m in removed]
+    return {
+        "summary": response.content,
+        "messages": delete_messages,
+        "context_tokens": count_tokens([SystemMessage(content=response.content)])
+        - (count_tokens([SystemMessage(content=summary)]) if summary else 0)
+        - count_tokens(removed),
+    }
 # %%
 # Determine whether to end or summarize the conversation
 def should_continue(state: State):
     """Return the next node to execute."""
 
-    messages = state["messages"]
-
-    # If there are more than six messages, then we summarize the conversation
-    if len(messages) > 6:
+    # If the context is over the high watermark, then we summarize the conversation
+    if state.get("context_tokens", 0) > SUMMARY_HIGH_WATERMARK:
         return "summarize_conversation"
 
     # Otherwise we can just end
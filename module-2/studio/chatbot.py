@@ -1,17 +1,49 @@
-from typing import Literal
+import logging
+import operator
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Annotated, Literal
 from langchain_core.messages import HumanMessage, SystemMessage, RemoveMessage
+from langchain_core.messages import get_buffer_string
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import MessagesState
 from langgraph.graph import StateGraph, START, END
+import configuration
 
 # We will use this model for both the conversation and the summarization
 from langchain_google_genai import ChatGoogleGenerativeAI
 
 llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
 
+logger = logging.getLogger(__name__)
+
 
 # State class to store messages and summary
 class State(MessagesState):
     summary: str
+    # Approximate tokens of the summary and messages, updated as they change
+    context_tokens: Annotated[int, operator.add]
+    # ID of the newest message counted in context_tokens
+    last_counted_id: str
+    # Hierarchical summaries of the evicted messages, rendered into summary
+    summary_tree: dict
+
+
+def count_tokens(messages: list) -> int:
+    """Approximate token count, computed offline and additive across messages."""
+    return sum(count_tokens_approximately([message]) for message in messages)
+
+
+def uncounted_messages(state: State) -> list:
+    """Messages added since context_tokens was last updated."""
+    messages = state["messages"]
+    last_counted_id = state.get("last_counted_id")
+    for i in range(len(messages) - 1, -1, -1):
+        if messages[i].id == last_counted_id:
+            return messages[i + 1 :]
+    return messages
 
 
 # Define the logic to call the model
@@ -31,55 +63,254 @@ def call_model(state: State):
         messages = state["messages"]
 
     response = llm.invoke(messages)
-    return {"messages": response}
+
+    # Add the new user messages and the response to the running token count
+    return {
+        "messages": response,
+        "context_tokens": count_tokens(uncounted_messages(state) + [response]),
+        "last_counted_id": response.id,
+    }
 
 
 # Determine whether to end or summarize the conversation
-def should_continue(state: State) -> Literal["summarize_conversation", "__end__"]:
+def should_continue(
+    state: State, config: RunnableConfig
+) -> Literal["summarize_conversation", "__end__"]:
     """Return the next node to execute."""
 
-    messages = state["messages"]
+    configurable = configuration.Configuration.from_runnable_config(config)
 
-    # If there are more than six messages, then we summarize the conversation
-    if len(messages) > 6:
+    # If the context is over the high watermark, then we summarize the conversation
+    if state.get("context_tokens", 0) > configurable.summary_high_watermark:
         return "summarize_conversation"
 
     # Otherwise we can just end
     return END
 
 
-def summarize_conversation(state: State):
-    # First get the summary if it exists
-    summary = state.get("summary", "")
+# The summary tree holds a leaf summary per chunk of evicted messages. Once a
+# level has `fanout` nodes, the oldest are merged into a node one level up, up
+# to `max_depth`, where they are merged into a single node at the same level.
+# The roots, oldest first, make up State.summary, so each pass only reads the
+# evicted chunk and the few summaries it merges.
+def new_summary_tree(summary: str = "") -> dict:
+    """An empty summary tree, or one seeded with an existing flat summary."""
+    if not summary:
+        return {"nodes": {}, "roots": []}
+    leaf = {"level": 0, "summary": summary, "children": [], "transcript": summary}
+    return {"nodes": {"0": leaf}, "roots": ["0"]}
 
-    # Create our summarization prompt
-    if summary:
-        # If a summary already exists, add it to the prompt
-        summary_message = (
-            f"This is summary of the conversation to date: {summary}\n\n"
-            "Extend the summary by taking into account the new messages above:"
+
+def summarize_chunk(messages: list) -> str:
+    """Summarize a chunk of evicted messages."""
+    response = llm.invoke(
+        messages + [HumanMessage(content="Create a summary of the conversation above:")]
+    )
+    return response.content
+
+
+def merge_summaries(summaries: list[str]) -> str:
+    """Merge consecutive summaries, oldest first, into one."""
+    parts = "\n\n".join(
+        f"Part {i}: {summary}" for i, summary in enumerate(summaries, 1)
+    )
+    response = llm.invoke(
+        [
+            HumanMessage(
+                content=f"{parts}\n\n"
+                "Combine these consecutive parts of a conversation summary into one summary:"
+            )
+        ]
+    )
+    return response.content
+
+
+def add_to_summary_tree(
+    tree: dict, messages: list, fanout: int, max_depth: int
+) -> dict:
+    """Return a copy of the tree with a leaf for the evicted messages, merged upward."""
+    nodes, roots = dict(tree["nodes"]), list(tree["roots"])
+
+    def add_node(level: int, summary: str, children: list, transcript: str = ""):
+        node_id = str(len(nodes))
+        nodes[node_id] = {
+            "level": level,
+            "summary": summary,
+            "children": children,
+            "transcript": transcript,
+        }
+        return node_id
+
+    roots.append(
+        add_node(0, summarize_chunk(messages), [], get_buffer_string(messages))
+    )
+
+    # Merge full levels, lowest first, so every root level holds < fanout nodes
+    for level in range(max_depth + 1):
+        level_roots = [node_id for node_id in roots if nodes[node_id]["level"] == level]
+        if len(level_roots) < fanout:
+            continue
+        children = level_roots[:fanout]
+        merged = add_node(
+            min(level + 1, max_depth),
+            merge_summaries([nodes[node_id]["summary"] for node_id in children]),
+            children,
         )
+        # The merged node takes the place of its oldest child
+        roots[roots.index(children[0])] = merged
+        roots = [node_id for node_id in roots if node_id not in children[1:]]
 
-    else:
-        # If no summary exists, just create a new one
-        summary_message = "Create a summary of the conversation above:"
+    return {"nodes": nodes, "roots": roots}
 
-    # Add prompt to our history
-    messages = state["messages"] + [HumanMessage(content=summary_message)]
-    response = llm.invoke(messages)
 
-    # Delete all but the 2 most recent messages and add our summary to the state
-    delete_messages = [RemoveMessage(id=m.id) for m in state["messages"][:-2]]
-    return {"summary": response.content, "messages": delete_messages}
+def render_summary_tree(tree: dict) -> str:
+    """The summary of the whole evicted conversation, oldest part first."""
+    return "\n\n".join(tree["nodes"][node_id]["summary"] for node_id in tree["roots"])
+
+
+def expand_summary(tree: dict, node_id: str) -> list[str]:
+    """Re-expand a summary node into its children's summaries, or a leaf into its messages."""
+    node = tree["nodes"][node_id]
+    if not node["children"]:
+        return [node["transcript"]]
+    return [tree["nodes"][child]["summary"] for child in node["children"]]
+
+
+def summarize(
+    messages: list, summary: str, tree: dict, configurable: configuration.Configuration
+) -> dict:
+    """Summarize the evicted messages and return the state update that applies it."""
+
+    # Keep the 2 most recent messages, plus older ones while they fit under the
+    # low watermark
+    kept, kept_tokens = 2, count_tokens(messages[-2:])
+    for message in reversed(messages[:-2]):
+        kept_tokens += count_tokens([message])
+        if kept_tokens > configurable.summary_low_watermark:
+            break
+        kept += 1
+    removed = messages[:-kept]
+    if not removed:
+        return {}
+
+    # Summarize only the evicted chunk into the tree
+    tree = add_to_summary_tree(
+        tree, removed, configurable.summary_fanout, configurable.summary_max_depth
+    )
+    new_summary = render_summary_tree(tree)
+
+    # Delete the older messages and add our summary to the state
+    delete_messages = [RemoveMessage(id=m.id) for m in removed]
+    return {
+        "summary": new_summary,
+        "summary_tree": tree,
+        "messages": delete_messages,
+        "context_tokens": count_tokens([SystemMessage(content=new_summary)])
+        - (count_tokens([SystemMessage(content=summary)]) if summary else 0)
+        - count_tokens(removed),
+    }
+
+
+# Summaries computed off the response path, by thread ID. Each future resolves
+# to the summary it extended and the state update that applies the new one.
+# Summaries not applied within PENDING_SUMMARY_TTL seconds, e.g. for threads
+# that never send another turn, are dropped, as are the oldest beyond
+# PENDING_SUMMARY_SIZE.
+PENDING_SUMMARY_SIZE = 1024
+PENDING_SUMMARY_TTL = 3600
+summary_executor = ThreadPoolExecutor(max_workers=4)
+pending_summaries: OrderedDict[str, tuple[float, Future]] = OrderedDict()
+
+
+def log_summary_failure(future: Future) -> None:
+    """Log a background summary that raised, since no turn waits on it."""
+    if future.exception() is not None:
+        logger.error("Background summary failed", exc_info=future.exception())
+
+
+def evict_summaries() -> None:
+    """Drop expired summaries, then the oldest ones beyond the size limit."""
+    now = time.monotonic()
+    while pending_summaries:
+        submitted_at, _ = next(iter(pending_summaries.values()))
+        if now - submitted_at <= PENDING_SUMMARY_TTL:
+            break
+        pending_summaries.popitem(last=False)
+    while len(pending_summaries) > PENDING_SUMMARY_SIZE:
+        pending_summaries.popitem(last=False)
+
+
+def summarize_in_background(
+    messages: list, summary: str, tree: dict, configurable: configuration.Configuration
+):
+    """Summarize, returning the summary extended along with the update."""
+    return summary, summarize(messages, summary, tree, configurable)
+
+
+def summarize_conversation(state: State, config: RunnableConfig):
+    configurable = configuration.Configuration.from_runnable_config(config)
+
+    # First get the summary and its tree if they exist
+    summary = state.get("summary", "")
+    tree = state.get("summary_tree") or new_summary_tree(summary)
+
+    # In background mode, start a summary for the thread unless one is running
+    thread_id = config.get("configurable", {}).get("thread_id")
+    if configurable.background_summarization and thread_id:
+        if thread_id not in pending_summaries:
+            future = summary_executor.submit(
+                summarize_in_background,
+                state["messages"],
+                summary,
+                tree,
+                configurable,
+            )
+            future.add_done_callback(log_summary_failure)
+            pending_summaries[thread_id] = (time.monotonic(), future)
+            evict_summaries()
+        return {}
+
+    return summarize(state["messages"], summary, tree, configurable)
+
+
+def apply_summary(state: State, config: RunnableConfig):
+    """Apply a finished background summary before the next response."""
+
+    # Leave summaries that are still running for a later turn
+    thread_id = config.get("configurable", {}).get("thread_id")
+    _, future = pending_summaries.get(thread_id, (None, None))
+    if future is None or not future.done():
+        return {}
+    pending_summaries.pop(thread_id, None)
+
+    # Failed summaries are logged when they finish; the next turn retries
+    if future.exception():
+        return {}
+    base_summary, update = future.result()
+
+    # Drop the summary if another one was applied, or the messages it replaces
+    # were removed, since it started
+    message_ids = {m.id for m in state["messages"]}
+    if (
+        not update
+        or state.get("summary", "") != base_summary
+        or any(m.id not in message_ids for m in update["messages"])
+    ):
+        return {}
+
+    # Messages added while it ran are not deleted, so they stay in context
+    return update
 
 
 # Define a new graph
-workflow = StateGraph(State)
+workflow = StateGraph(State, config_schema=configuration.Configuration)
+workflow.add_node(apply_summary)
 workflow.add_node("conversation", call_model)
 workflow.add_node(summarize_conversation)
 
-# Set the entrypoint as conversation
-workflow.add_edge(START, "conversation")
+# Apply any background summary, then continue the conversation
+workflow.add_edge(START, "apply_summary")
+workflow.add_edge("apply_summary", "conversation")
 workflow.add_conditional_edges("conversation", should_continue)
 workflow.add_edge("summarize_conversation", END)
 
@@ -0,0 +1,51 @@
+import os
+from dataclasses import dataclass, fields
+from typing import Any, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+
+def _coerce(value: Any, default: Any) -> Any:
+    """Coerce string values (e.g. from environment variables) to the type of the default."""
+    if not isinstance(value, str) or isinstance(default, str):
+        return value
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+@dataclass(kw_only=True)
+class Configuration:
+    """The configurable fields for the chatbot."""
+
+    # Summarization
+    summary_high_watermark: int = 4000  # Context tokens that trigger a summary
+    summary_low_watermark: int = 1000  # Max tokens of messages kept after a summary
+    background_summarization: bool = False  # Summarize off the response path
+    summary_fanout: int = 4  # Summaries merged into one node of the summary tree
+    summary_max_depth: int = 3  # Levels above the leaves in the summary tree
+
+    @classmethod
+    def from_runnable_config(
+        cls, config: Optional[RunnableConfig] = None
+    ) -> "Configuration":
+        """Create a Configuration instance from a RunnableConfig."""
+        configurable = (
+            config["configurable"] if config and "configurable" in config else {}
+        )
+        values: dict[str, Any] = {
+            f.name: os.environ.get(f.name.upper(), configurable.get(f.name))
+            for f in fields(cls)
+            if f.init
+        }
+        return cls(
+            **{
+                f.name: _coerce(values[f.name], f.default)
+                for f in fields(cls)
+                if f.init and values[f.name]
+            }
+        )
@@ -1,11 +1,13 @@
 # %%
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages import get_buffer_string
 from langchain_google_genai import ChatGoogleGenerativeAI
 from IPython.display import Image, display
 from langgraph.graph import MessagesState
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import RemoveMessage
 from langchain_core.messages import trim_messages
+from langchain_core.messages.utils import count_tokens_approximately
 
 # %%
 messages = [AIMessage("So you said you were researching ocean mammals?", name="Bot")]
@@ -109,13 +111,52 @@ output = graph.invoke({"messages": messages})
 for m in output["messages"]:
     m.pretty_print()
 # %%
+class CachedTokenCounter:
+    """Token counter for trim_messages that counts each message only once.
+
+    Messages are immutable once added to the state, so counts are memoized by
+    message ID. New messages are counted locally with count_tokens_approximately,
+    or, when a model is given, with one remote count for all of them that is
+    apportioned to each message by its share of the local estimate.
+    """
+
+    def __init__(self, model=None):
+        self.model = model
+        self.counts = {}
+
+    def count(self, messages: list[BaseMessage]) -> list[int]:
+        """Count messages that are not cached yet, in one batch."""
+        estimates = [count_tokens_approximately([m]) for m in messages]
+        if self.model is None or not messages:
+            return estimates
+        # get_num_tokens_from_messages would make one remote call per message
+        total = self.model.get_num_tokens(get_buffer_string(messages))
+        scale = total / max(1, sum(estimates))
+        return [round(estimate * scale) for estimate in estimates]
+
+    def __call__(self, messages: list[BaseMessage]) -> int:
+        new = [m for m in messages if m.id is None or m.id not in self.counts]
+        new_counts = dict(zip(map(id, new), self.count(new)))
+        for m in new:
+            # Messages without an ID can't be memoized
+            if m.id is not None:
+                self.counts[m.id] = new_counts[id(m)]
+        return sum(
+            self.counts[m.id] if m.id is not None else new_counts[id(m)]
+            for m in messages
+        )
+
+
+# Count locally; pass the chat model to batch remote counts instead
+token_counter = CachedTokenCounter()
+# %%
 # Node
 def chat_model_node(state: MessagesState):
     messages = trim_messages(
         state["messages"],
         max_tokens=100,
         strategy="last",
-        token_counter=ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite-preview-06-17"),
+        token_counter=token_counter,
         allow_partial=False,
     )
     return {"messages": [llm.invoke(messages)]}
@@ -139,10 +180,108 @@ trim_messages(
     messages,
     max_tokens=100,
     strategy="last",
-    token_counter=ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite-preview-06-17"),
+    token_counter=token_counter,
     allow_partial=False,
 )
 # %%
 # Invoke, using message trimming in the chat_model_node
 messages_out_trim = graph.invoke({"messages": messages})
 # %%
+def stable_cut(
+    messages: list[BaseMessage], max_tokens: int, step_tokens: int, anchor: int
+) -> int:
+    """Index where the retained window starts, advanced in coarse steps.
+
+    The first `anchor` messages are always kept. Candidate cut points are laid
+    out from the start of the history, at user turns at least `step_tokens`
+    apart, so they don't move as new messages are appended. The earliest one
+    whose window fits in `max_tokens` is used, so the cut only advances when the
+    budget forces it. If none fits, the latest one is used.
+    """
+    counts = [token_counter([m]) for m in messages]
+    budget = max_tokens - sum(counts[:anchor])
+    cut, window, dropped = anchor, sum(counts[anchor:]), 0
+    for i in range(anchor + 1, len(messages)):
+        if window <= budget:
+            break
+        dropped += counts[i - 1]
+        if dropped >= step_tokens and isinstance(messages[i], HumanMessage):
+            cut, window, dropped = i, window - dropped, 0
+    return cut
+
+
+def trim_stable(
+    messages: list[BaseMessage],
+    max_tokens: int,
+    step_tokens: int,
+    anchor_messages: int = 0,
+) -> tuple[list[BaseMessage], int]:
+    """Trim to an anchored prefix plus a window that starts at a stable cut.
+
+    The leading system messages and the next `anchor_messages` messages form
+    the anchored prefix. Returns the trimmed messages and the number of leading
+    tokens shared with the previous turn's prompt, which a provider can serve
+    from its prompt cache.
+    """
+    anchor = 0
+    while anchor < len(messages) and isinstance(messages[anchor], SystemMessage):
+        anchor += 1
+    anchor = min(anchor + anchor_messages, len(messages))
+    cut = stable_cut(messages, max_tokens, step_tokens, anchor)
+    trimmed = messages[:anchor] + messages[cut:]
+
+    # The previous prompt is the history before the latest response
+    previous = next(
+        (
+            i
+            for i in range(len(messages) - 1, -1, -1)
+            if isinstance(messages[i], AIMessage)
+        ),
+        None,
+    )
+    if previous is None:
+        return trimmed, 0
+    reusable = messages[: min(anchor, previous)]
+    if (
+        previous > anchor
+        and stable_cut(messages[:previous], max_tokens, step_tokens, anchor) == cut
+    ):
+        reusable += messages[cut:previous]
+    return trimmed, token_counter(reusable)
+
+
+# Keep the first exchange, and drop older messages at least 50 tokens at a time
+TRIM_MAX_TOKENS = 100
+TRIM_STEP_TOKENS = 50
+TRIM_ANCHOR_MESSAGES = 2
+
+
+class TrimState(MessagesState):
+    reusable_prefix_tokens: int
+
+
+# Node
+def chat_model_node(state: TrimState):
+    messages, reusable_prefix_tokens = trim_stable(
+        state["messages"], TRIM_MAX_TOKENS, TRIM_STEP_TOKENS, TRIM_ANCHOR_MESSAGES
+    )
+    return {
+        "messages": [llm.invoke(messages)],
+        "reusable_prefix_tokens": reusable_prefix_tokens,
+    }
+
+
+# Build graph
+builder = StateGraph(TrimState)
+builder.add_node("chat_model", chat_model_node)
+builder.add_edge(START, "chat_model")
+builder.add_edge("chat_model", END)
+graph = builder.compile()
+
+# View
+display(Image(graph.get_graph().draw_mermaid_png()))
+# %%
+# Invoke, using prefix-stable trimming in the chat_model_node
+messages_out_stable = graph.invoke({"messages": messages})
+messages_out_stable["reusable_prefix_tokens"]
+# %%
@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.checkpoint.memory import MemorySaver
+
+# The Gemini client needs an API key at import time, even though it is swapped out
+os.environ.setdefault("GOOGLE_API_KEY", "offline")
+
+import research_assistant
+from fakes import FakeResearchLLM, use_fakes
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Callback that records the wall time of every graph node run"""
+
+    def __init__(self):
+        self.started: dict = {}
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+
+    def on_chain_start(
+        self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs
+    ):
+        node = (metadata or {}).get("langgraph_node")
+        if not node or kwargs.get("name") != node:
+            return
+        # A node wrapping a RunnableLambda starts a second chain with its name
+        parent = self.started.get(parent_run_id)
+        if parent and parent[0] == node:
+            return
+        self.started[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        if run_id in self.started:
+            node, started_at = self.started.pop(run_id)
+            self.latencies[node].append(time.perf_counter() - started_at)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.started.pop(run_id, None)
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_once(graph, args, timer: NodeTimer) -> float:
+    """Run the full research graph once and return its wall time"""
+    config = {
+        "configurable": {
+            "thread_id": str(uuid.uuid4()),
+            "search_cache_path": os.path.join(args.workdir, f"{uuid.uuid4()}.db"),
+        },
+        "callbacks": [timer],
+    }
+    started_at = time.perf_counter()
+    await graph.ainvoke(
+        {
+            "topic": "Offline benchmark",
+            "max_analysts": args.analysts,
+            "max_num_turns": args.turns,
+            "max_concurrent_interviews": args.max_concurrent_interviews,
+            "combine_intro_conclusion": args.combine_intro_conclusion,
+        },
+        config,
+    )
+    await graph.aupdate_state(
+        config, {"human_analyst_feedback": "approve"}, as_node="human_feedback"
+    )
+    await graph.ainvoke(None, config)
+    return time.perf_counter() - started_at
+
+
+async def main(args):
+    llm = (
+        FakeResearchLLM.from_recordings(args.recordings, latency=args.llm_latency)
+        if args.recordings
+        else FakeResearchLLM(latency=args.llm_latency)
+    )
+    use_fakes(research_assistant, llm, search_latency=args.search_latency)
+
+    graph = research_assistant.builder.compile(
+        checkpointer=MemorySaver(), interrupt_before=["human_feedback"]
+    )
+
+    timer = NodeTimer()
+    wall_times = [await run_once(graph, args, timer) for _ in range(args.runs)]
+
+    print(
+        f"{args.analysts} analysts x {args.turns} turns, {args.runs} runs: "
+        f"wall p50 {statistics.median(wall_times):.3f}s, "
+        f"max {max(wall_times):.3f}s, "
+        f"{llm.calls / args.runs:.1f} LLM calls per run"
+    )
+    print(f"{'node':<36}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for node, latencies in sorted(timer.latencies.items()):
+        print(
+            f"{node:<36}{len(latencies):>7}"
+            f"{percentile(latencies, 0.5) * 1000:>10.1f}"
+            f"{percentile(latencies, 0.95) * 1000:>10.1f}"
+            f"{max(latencies) * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the research assistant graph offline"
+    )
+    parser.add_argument("--analysts", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--search-latency", type=float, default=0.0)
+    parser.add_argument("--max-concurrent-interviews", type=int, default=0)
+    parser.add_argument("--combine-intro-conclusion", action="store_true")
+    parser.add_argument("--recordings", help="JSONL written by ResponseRecorder")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        asyncio.run(main(args))
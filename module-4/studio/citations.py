@@ -0,0 +1,53 @@
+import re
+
+# Bracketed citation numbers, e.g. [3]
+CITATION = re.compile(r"\[(\d+)\]")
+
+
+def cited_sources(content: str, sources: list) -> list:
+    """Sources cited in the content, as {"number", "source"} in citation order
+
+    `sources` lists the documents the content was written from, where the
+    document numbered [n] is sources[n - 1].
+    """
+    cited = {}
+    for match in CITATION.finditer(content):
+        number = int(match.group(1))
+        if 0 < number <= len(sources):
+            cited.setdefault(number, sources[number - 1])
+    return [{"number": number, "source": source} for number, source in cited.items()]
+
+
+class CitationIndex:
+    """Global, deduplicated numbering of the sources cited across sections"""
+
+    def __init__(self):
+        self._numbers: dict[str, int] = {}
+
+    def add(self, source: str) -> int:
+        """Return the global number of a source, assigning the next one if new"""
+        return self._numbers.setdefault(source, len(self._numbers) + 1)
+
+    def renumber(self, section: dict) -> str:
+        """Rewrite a section's local citation numbers to global ones"""
+        numbers = {
+            str(citation["number"]): str(self.add(citation["source"]))
+            for citation in section["sources"]
+        }
+        return CITATION.sub(
+            lambda match: f"[{numbers.get(match.group(1), match.group(1))}]",
+            section["content"],
+        )
+
+    @property
+    def sources(self) -> list[str]:
+        """Sources in global citation order"""
+        return list(self._numbers)
+
+
+def format_sources(sources: list[str]) -> str:
+    """Markdown Sources block for sources in global citation order"""
+    # Two trailing spaces force a markdown line break
+    return "## Sources\n" + "\n".join(
+        f"[{number}] {source}  " for number, source in enumerate(sources, 1)
+    )
@@ -0,0 +1,64 @@
+import os
+from dataclasses import dataclass, fields
+from typing import Any, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+
+def _coerce(value: Any, default: Any) -> Any:
+    """Coerce string values (e.g. from environment variables) to the type of the default."""
+    if not isinstance(value, str) or isinstance(default, str):
+        return value
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    if isinstance(default, tuple):
+        return tuple(item.strip() for item in value.split(","))
+    return value
+
+
+@dataclass(kw_only=True)
+class Configuration:
+    """The configurable fields for the research assistant."""
+
+    # Search cache
+    search_cache_path: str = "search_cache.db"
+    search_cache_ttl: float = 7 * 24 * 60 * 60  # Seconds
+    search_cache_max_entries: int = 1000
+    search_offline: bool = False  # Only serve searches from the cache
+    search_timeout: float = 10.0  # Seconds to wait on each search backend
+
+    # Context packing
+    context_token_budget: int = 6000  # Max tokens of source docs per prompt
+
+    # Report
+    # Section tokens above which the introduction and conclusion share one call
+    combine_intro_conclusion_tokens: int = 8000
+
+    # Interviews
+    # Phrases that end an interview when the analyst's question ends with one
+    stop_phrases: tuple[str, ...] = ("Thank you so much for your help",)
+
+    @classmethod
+    def from_runnable_config(
+        cls, config: Optional[RunnableConfig] = None
+    ) -> "Configuration":
+        """Create a Configuration instance from a RunnableConfig."""
+        configurable = (
+            config["configurable"] if config and "configurable" in config else {}
+        )
+        values: dict[str, Any] = {
+            f.name: os.environ.get(f.name.upper(), configurable.get(f.name))
+            for f in fields(cls)
+            if f.init
+        }
+        return cls(
+            **{
+                f.name: _coerce(values[f.name], f.default)
+                for f in fields(cls)
+                if f.init and values[f.name]
+            }
+        )
@@ -0,0 +1,85 @@
+import math
+import re
+from collections import Counter
+
+
+def doc_key(doc: dict) -> str:
+    """Identity of a source doc: its URL, or its source and page"""
+    if "url" in doc:
+        return doc["url"]
+    return f"{doc['source']}#{doc.get('page', '')}"
+
+
+def merge_context(existing: list, new: list) -> list:
+    """Reducer that appends new source docs, dropping ones already in context"""
+    seen = {doc_key(doc) for doc in existing}
+    merged = list(existing)
+    for doc in new:
+        key = doc_key(doc)
+        if key not in seen:
+            seen.add(key)
+            merged.append(doc)
+    return merged
+
+
+def approximate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+def format_doc(doc: dict) -> str:
+    """Format a source doc with the <Document> tag the prompts refer to"""
+    if "url" in doc:
+        tag = f'<Document href="{doc["url"]}"/>'
+    else:
+        tag = f'<Document source="{doc["source"]}" page="{doc.get("page", "")}"/>'
+    return f"{tag}\n{doc['content']}\n</Document>"
+
+
+def doc_citation(doc: dict) -> str:
+    """Source reference for a doc, as listed in a Sources section"""
+    if "url" in doc:
+        return doc["url"]
+    if doc.get("page"):
+        return f"{doc['source']}, page {doc['page']}"
+    return doc["source"]
+
+
+def format_context(docs: list, numbered: bool = False) -> str:
+    """Join formatted source docs into a single context string"""
+    if numbered:
+        return "\n\n---\n\n".join(
+            f"[{number}] {format_doc(doc)}" for number, doc in enumerate(docs, 1)
+        )
+    return "\n\n---\n\n".join(format_doc(doc) for doc in docs)
+
+
+def _terms(text: str) -> list[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def rank_docs(docs: list, query: str) -> list:
+    """Order docs by lexical overlap with the query, best first"""
+    query_terms = set(_terms(query))
+    if not query_terms:
+        return list(docs)
+
+    def score(doc: dict) -> float:
+        counts = Counter(_terms(doc["content"]))
+        return sum(math.log1p(counts[term]) for term in query_terms) / math.sqrt(
+            1 + sum(counts.values())
+        )
+
+    # sorted() is stable, so ties keep their retrieval order
+    return sorted(docs, key=score, reverse=True)
+
+
+def pack_context(docs: list, query: str, token_budget: int) -> list:
+    """Select the docs most relevant to the query that fit in the token budget"""
+    packed, remaining = [], token_budget
+    for doc in rank_docs(docs, query):
+        tokens = approximate_tokens(format_doc(doc))
+        if tokens <= remaining:
+            packed.append(doc)
+            remaining -= tokens
+    return packed
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Any, Optional, get_args, get_origin
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    convert_to_messages,
+    get_buffer_string,
+)
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, Field, PrivateAttr
+
+
+def prompt_key(messages: list) -> str:
+    """Content address of a prompt, used to match recorded responses"""
+    return hashlib.sha256(get_buffer_string(messages).encode()).hexdigest()
+
+
+def _synthesize(schema: type[BaseModel], count: int, seed: str) -> BaseModel:
+    """Build a deterministic instance of a pydantic schema"""
+    values = {}
+    for name, field in schema.model_fields.items():
+        annotation = field.annotation
+        if get_origin(annotation) in (list, tuple):
+            item = get_args(annotation)[0]
+            if isinstance(item, type) and issubclass(item, BaseModel):
+                values[name] = [
+                    _synthesize(item, count, f"{seed}-{i}") for i in range(count)
+                ]
+            else:
+                values[name] = [f"{name} {seed}-{i}" for i in range(count)]
+        elif isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            values[name] = _synthesize(annotation, count, seed)
+        else:
+            values[name] = f"{name} {seed}"
+    return schema(**values)
+
+
+class FakeResearchLLM(BaseChatModel):
+    """Deterministic chat model for running the research graph offline.
+
+    Responses are replayed from `recordings` (prompt key -> content) when the
+    prompt was recorded, and synthesized from the prompt otherwise. Every call
+    sleeps for `latency` seconds to simulate provider round-trips.
+    """
+
+    latency: float = 0.0
+    recordings: dict[str, str] = Field(default_factory=dict)
+    _calls: int = PrivateAttr(default=0)
+
+    @classmethod
+    def from_recordings(cls, path: str, **kwargs: Any) -> "FakeResearchLLM":
+        """Load responses recorded by ResponseRecorder"""
+        with open(path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        recordings = {record["key"]: record["content"] for record in records}
+        return cls(recordings=recordings, **kwargs)
+
+    @property
+    def calls(self) -> int:
+        """Number of model calls made so far"""
+        return self._calls
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-research"
+
+    def _respond(self, messages: list[BaseMessage]) -> str:
+        self._calls += 1
+        key = prompt_key(messages)
+        if key in self.recordings:
+            return self.recordings[key]
+        # Cite the first two source documents so citation handling is exercised
+        return f"Response {key[:8]} citing [1] and [2]."
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        message = AIMessage(content=self._respond(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        message = AIMessage(content=self._respond(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def with_structured_output(self, schema, **kwargs):
+        """Synthesize instances of `schema`, sized by any "top N" in the prompt"""
+
+        def respond(messages: list) -> BaseModel:
+            self._calls += 1
+            messages = convert_to_messages(messages)
+            match = re.search(r"top (\d+)", get_buffer_string(messages))
+            count = int(match.group(1)) if match else 1
+            return _synthesize(schema, count, prompt_key(messages)[:8])
+
+        def synthesize(messages: list) -> BaseModel:
+            time.sleep(self.latency)
+            return respond(messages)
+
+        async def asynthesize(messages: list) -> BaseModel:
+            await asyncio.sleep(self.latency)
+            return respond(messages)
+
+        return RunnableLambda(synthesize, afunc=asynthesize)
+
+
+class ResponseRecorder(BaseCallbackHandler):
+    """Callback that records chat model responses for FakeResearchLLM replay"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._prompts: dict[Any, str] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._prompts[run_id] = prompt_key(messages[0])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        key = self._prompts.pop(run_id, None)
+        message = response.generations[0][0].message
+        if key is None or message.tool_calls:
+            return
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"key": key, "content": message.content}) + "\n")
+
+
+def fake_search_backend(source: str, latency: float = 0.0, max_docs: int = 2):
+    """Search backend returning deterministic docs after `latency` seconds"""
+
+    def search(query: str) -> list:
+        time.sleep(latency)
+        digest = hashlib.sha256(query.encode()).hexdigest()
+        docs = []
+        for i in range(max_docs):
+            url = f"https://{source}.example.com/{digest[:8]}/{i}"
+            content = f"{source} result {i} for {query}"
+            if source == "web":
+                docs.append({"url": url, "content": content})
+            else:
+                docs.append({"source": url, "page": "", "content": content})
+        return docs
+
+    return search
+
+
+def use_fakes(
+    module: Any, llm: Optional[FakeResearchLLM] = None, search_latency: float = 0.0
+) -> FakeResearchLLM:
+    """Swap the research assistant's model and search backends for fakes"""
+    module.llm = llm or FakeResearchLLM()
+    for source in module.search_backends:
+        module.search_backends[source] = fake_search_backend(source, search_latency)
+    return module.llm
@@ -1,4 +1,10 @@
+import asyncio
 import operator
+import time
+import uuid
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field
 from typing import Annotated, List
 from typing_extensions import TypedDict
@@ -6,15 +12,29 @@ from typing_extensions import TypedDict
 from langchain_community.document_loaders import WikipediaLoader
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.messages import (
-    AIMessage,
     HumanMessage,
     SystemMessage,
     get_buffer_string,
 )
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_google_genai import ChatGoogleGenerativeAI
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.config import get_stream_writer
 from langgraph.constants import Send
 from langgraph.graph import END, MessagesState, START, StateGraph
 
+import configuration
+from citations import CitationIndex, cited_sources, format_sources
+from context_store import (
+    approximate_tokens,
+    doc_citation,
+    format_context,
+    merge_context,
+    pack_context,
+)
+from scheduling import ainterview_slot, athrottle, interview_slot, throttle
+from search_cache import get_search_cache, normalize_query
+
 ### LLM
 
 llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
@@ -54,26 +74,50 @@ class GenerateAnalystsState(TypedDict):
 
 class InterviewState(MessagesState):
     max_num_turns: int  # Number turns of conversation
-    context: Annotated[list, operator.add]  # Source docs
+    num_turns: int  # Number of expert answers so far
+    interview_complete: bool  # Analyst has signalled the end of the interview
+    context: Annotated[list, merge_context]  # Source docs, deduplicated
     analyst: Analyst  # Analyst asking questions
     interview: str  # Interview transcript
     sections: list  # Final key we duplicate in outer state for Send() API
+    search_cache_hits: Annotated[int, operator.add]  # Searches served from cache
+    search_cache_misses: Annotated[int, operator.add]  # Searches sent to the network
+    rate_limits: dict  # Requests per second by provider ("llm", "web", "wikipedia")
+    max_concurrent_interviews: int  # Interviews allowed in flight at once
+    dispatch_id: str  # Fan-out this interview belongs to
 
 
 class SearchQuery(BaseModel):
     search_query: str = Field(None, description="Search query for retrieval.")
 
 
+class IntroductionConclusion(BaseModel):
+    introduction: str = Field(
+        description="Report title and introduction section, in markdown.",
+    )
+    conclusion: str = Field(
+        description="Report conclusion section, in markdown.",
+    )
+
+
 class ResearchGraphState(TypedDict):
     topic: str  # Research topic
     max_analysts: int  # Number of analysts
+    max_num_turns: int  # Number turns of conversation per interview
     human_analyst_feedback: str  # Human feedback
     analysts: List[Analyst]  # Analyst asking questions
-    sections: Annotated[list, operator.add]  # Send() API key
+    sections: Annotated[list, operator.add]  # Send() API key, with cited sources
+    section_digest: dict  # Joined sections, citation table and token count
+    combine_intro_conclusion: bool  # Write intro and conclusion in one call
     introduction: str  # Introduction for the final report
     content: str  # Content for the final report
     conclusion: str  # Conclusion for the final report
     final_report: str  # Final report
+    search_cache_hits: Annotated[int, operator.add]  # Summed across interviews
+    search_cache_misses: Annotated[int, operator.add]  # Summed across interviews
+    rate_limits: dict  # Requests per second by provider ("llm", "web", "wikipedia")
+    max_concurrent_interviews: int  # Interviews allowed in flight at once (0 = all)
+    interview_metrics: Annotated[list, operator.add]  # Queue wait and run time
 
 
 ### Nodes and edges
@@ -146,19 +190,29 @@ When you are satisfied with your understanding, complete the interview with: "Th
 Remember to stay in character throughout your response, reflecting the persona and goals provided to you."""
 
 
-def generate_question(state: InterviewState):
+def generate_question(state: InterviewState, config: RunnableConfig):
     """Node to generate a question"""
 
     # Get state
     analyst = state["analyst"]
     messages = state["messages"]
+    configurable = configuration.Configuration.from_runnable_config(config)
 
     # Generate question
     system_message = question_instructions.format(goals=analyst.persona)
+    throttle(state.get("rate_limits"), "llm")
     question = llm.invoke([SystemMessage(content=system_message)] + messages)
 
+    # Check if the question signals the end of discussion, which the analyst
+    # only does by closing with a stop phrase
+    normalized_question = f" {normalize_query(str(question.content))}"
+    interview_complete = any(
+        normalized_question.endswith(f" {normalize_query(phrase)}")
+        for phrase in configurable.stop_phrases
+    )
+
     # Write messages to state
-    return {"messages": [question]}
+    return {"messages": [question], "interview_complete": interview_complete}
 
 
 # Search query writing
@@ -175,51 +229,132 @@ Convert this final question into a well-structured web search query"""
 )
 
 
-def search_web(state: InterviewState):
-    """Retrieve docs from web search"""
+def tavily_search(query: str) -> list:
+    """Run a web search with Tavily"""
 
-    # Search
     tavily_search = TavilySearchResults(max_results=3)
+    return tavily_search.invoke(query)
 
-    # Search query
-    structured_llm = llm.with_structured_output(SearchQuery)
-    search_query = structured_llm.invoke([search_instructions] + state["messages"])
 
-    # Search
-    search_docs = tavily_search.invoke(search_query.search_query)
+def wikipedia_search(query: str) -> list:
+    """Run a Wikipedia search and return JSON-serializable docs"""
 
-    # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document href="{doc["url"]}"/>\n{doc["content"]}\n</Document>'
-            for doc in search_docs
-        ]
+    search_docs = WikipediaLoader(query=query, load_max_docs=2).load()
+    return [
+        {
+            "source": doc.metadata["source"],
+            "page": doc.metadata.get("page", ""),
+            "content": doc.page_content,
+        }
+        for doc in search_docs
+    ]
+
+
+# Search backends, keyed by source name
+search_backends = {"web": tavily_search, "wikipedia": wikipedia_search}
+
+
+def cached_search(
+    source: str,
+    query: str,
+    configurable: configuration.Configuration,
+    rate_limits: dict | None = None,
+) -> tuple[list, bool]:
+    """Serve a search from the cache, falling back to the backend on a miss"""
+
+    def search(query: str) -> list:
+        throttle(rate_limits, source)
+        return search_backends[source](query)
+
+    cache = get_search_cache(
+        configurable.search_cache_path,
+        configurable.search_cache_ttl,
+        configurable.search_cache_max_entries,
     )
+    return cache.fetch(source, query, search, offline=configurable.search_offline)
+
 
-    return {"context": [formatted_search_docs]}
+def collect_searches(done: set, total: int) -> dict:
+    """State update with the docs of the searches that finished in time"""
+    context, hits = [], 0
+    for search in done:
+        if search.exception() is not None:
+            continue
+        search_docs, hit = search.result()
+        context.extend(search_docs)
+        hits += hit
 
+    return {
+        "context": context,
+        "search_cache_hits": hits,
+        "search_cache_misses": total - hits,
+    }
 
-def search_wikipedia(state: InterviewState):
-    """Retrieve docs from wikipedia"""
 
-    # Search query
+def search_sources(state: InterviewState, config: RunnableConfig):
+    """Retrieve docs from all search backends concurrently"""
+
+    configurable = configuration.Configuration.from_runnable_config(config)
+
+    # Search query, generated once for all backends
     structured_llm = llm.with_structured_output(SearchQuery)
+    throttle(state.get("rate_limits"), "llm")
     search_query = structured_llm.invoke([search_instructions] + state["messages"])
 
-    # Search
-    search_docs = WikipediaLoader(
-        query=search_query.search_query, load_max_docs=2
-    ).load()
+    # Search every backend under a shared deadline
+    executor = ThreadPoolExecutor(max_workers=len(search_backends))
+    searches = [
+        executor.submit(
+            cached_search,
+            source,
+            search_query.search_query,
+            configurable,
+            state.get("rate_limits"),
+        )
+        for source in search_backends
+    ]
+    done, _ = futures.wait(searches, timeout=configurable.search_timeout)
 
-    # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document source="{doc.metadata["source"]}" page="{doc.metadata.get("page", "")}"/>\n{doc.page_content}\n</Document>'
-            for doc in search_docs
-        ]
+    # Sources that missed the deadline keep running and still fill the cache
+    executor.shutdown(wait=False)
+
+    # Keep whatever arrived in time
+    return collect_searches(done, len(searches))
+
+
+async def asearch_sources(state: InterviewState, config: RunnableConfig):
+    """Retrieve docs from all search backends concurrently"""
+
+    configurable = configuration.Configuration.from_runnable_config(config)
+
+    # Search query, generated once for all backends
+    structured_llm = llm.with_structured_output(SearchQuery)
+    await athrottle(state.get("rate_limits"), "llm")
+    search_query = await structured_llm.ainvoke(
+        [search_instructions] + state["messages"]
     )
 
-    return {"context": [formatted_search_docs]}
+    # Search every backend under a shared deadline
+    searches = [
+        asyncio.create_task(
+            asyncio.to_thread(
+                cached_search,
+                source,
+                search_query.search_query,
+                configurable,
+                state.get("rate_limits"),
+            )
+        )
+        for source in search_backends
+    ]
+    done, pending = await asyncio.wait(searches, timeout=configurable.search_timeout)
+
+    # Sources that missed the deadline keep running and still fill the cache
+    for search in pending:
+        search.cancel()
+
+    # Keep whatever arrived in time
+    return collect_searches(done, len(searches))
 
 
 # Generate expert answer
@@ -252,23 +387,33 @@ When answering questions, follow these guidelines:
 And skip the addition of the brackets as well as the Document source preamble in your citation."""
 
 
-def generate_answer(state: InterviewState):
+def generate_answer(state: InterviewState, config: RunnableConfig):
     """Node to answer a question"""
 
     # Get state
     analyst = state["analyst"]
     messages = state["messages"]
-    context = state["context"]
+    configurable = configuration.Configuration.from_runnable_config(config)
+
+    # Pack the source docs most relevant to the question into the budget
+    context = format_context(
+        pack_context(
+            state["context"],
+            str(messages[-1].content),
+            configurable.context_token_budget,
+        )
+    )
 
     # Answer question
     system_message = answer_instructions.format(goals=analyst.persona, context=context)
+    throttle(state.get("rate_limits"), "llm")
     answer = llm.invoke([SystemMessage(content=system_message)] + messages)
 
     # Name the message as coming from the expert
     answer.name = "expert"
 
     # Append it to state
-    return {"messages": [answer]}
+    return {"messages": [answer], "num_turns": state.get("num_turns", 0) + 1}
 
 
 def save_interview(state: InterviewState):
@@ -284,27 +429,19 @@ def save_interview(state: InterviewState):
     return {"interview": interview}
 
 
-def route_messages(state: InterviewState, name: str = "expert"):
-    """Route between question and answer"""
-
-    # Get messages
-    messages = state["messages"]
-    max_num_turns = state.get("max_num_turns", 2)
-
-    # Check the number of expert answers
-    num_responses = len(
-        [m for m in messages if isinstance(m, AIMessage) and m.name == name]
-    )
+def route_question(state: InterviewState):
+    """Route to search, or end the interview if the analyst is satisfied"""
 
-    # End if expert has answered more than the max turns
-    if num_responses >= max_num_turns:
+    if state.get("interview_complete"):
         return "save_interview"
+    return "search_sources"
 
-    # This router is run after each question - answer pair
-    # Get the last question asked to check if it signals the end of discussion
-    last_question = messages[-2]
 
-    if "Thank you so much for your help" in last_question.content:
+def route_messages(state: InterviewState):
+    """Route between question and answer"""
+
+    # End if expert has answered more than the max turns
+    if state.get("num_turns", 0) >= state.get("max_num_turns", 2):
         return "save_interview"
     return "ask_question"
 
@@ -315,7 +452,7 @@ section_writer_instructions = """You are an expert technical writer.
 Your task is to create a short, easily digestible section of a report based on a set of source documents.
 
 1. Analyze the content of the source documents: 
-- The name of each source document is at the start of the document, with the <Document tag.
+- Each source document is numbered, and its name is at the start of the document, with the <Document tag.
         
 2. Create a report structure using markdown formatting:
 - Use ## for the section title
@@ -324,7 +461,6 @@ Your task is to create a short, easily digestible section of a report based on a
 3. Write the report following this structure:
 a. Title (## header)
 b. Summary (### header)
-c. Sources (### header)
 
 4. Make your title engaging based upon the focus area of the analyst: 
 {focus}
@@ -332,75 +468,133 @@ c. Sources (### header)
 5. For the summary section:
 - Set up summary with general background / context related to the focus area of the analyst
 - Emphasize what is novel, interesting, or surprising about insights gathered from the interview
-- Create a numbered list of source documents, as you use them
 - Do not mention the names of interviewers or experts
 - Aim for approximately 400 words maximum
-- Use numbered sources in your report (e.g., [1], [2]) based on information from source documents
+- Cite source documents using the number shown before each document (e.g., [1], [2])
         
-6. In the Sources section:
-- Include all sources used in your report
-- Provide full links to relevant websites or specific document paths
-- Separate each source by a newline. Use two spaces at the end of each line to create a newline in Markdown.
-- It will look like:
-
-### Sources
-[1] Link or Document name
-[2] Link or Document name
-
-7. Be sure to combine sources. For example this is not correct:
-
-[3] https://ai.meta.com/blog/meta-llama-3-1/
-[4] https://ai.meta.com/blog/meta-llama-3-1/
-
-There should be no redundant sources. It should simply be:
-
-[3] https://ai.meta.com/blog/meta-llama-3-1/
+6. Do not add a Sources section. The list of sources is added to the report separately.
         
-8. Final review:
+7. Final review:
 - Ensure the report follows the required structure
 - Include no preamble before the title of the report
 - Check that all guidelines have been followed"""
 
 
-def write_section(state: InterviewState):
+def write_section(state: InterviewState, config: RunnableConfig):
     """Node to write a section"""
 
     # Get state
     interview = state["interview"]
-    context = state["context"]
     analyst = state["analyst"]
+    configurable = configuration.Configuration.from_runnable_config(config)
+
+    # Pack the source docs most relevant to the analyst's focus into the budget
+    docs = pack_context(
+        state["context"], analyst.description, configurable.context_token_budget
+    )
+    context = format_context(docs, numbered=True)
 
     # Write section using either the gathered source docs from interview (context) or the interview itself (interview)
     system_message = section_writer_instructions.format(focus=analyst.description)
+    throttle(state.get("rate_limits"), "llm")
     section = llm.invoke(
         [SystemMessage(content=system_message)]
         + [HumanMessage(content=f"Use this source to write your section: {context}")]
     )
 
+    # Keep the sources the section cites, by their number in the context
+    content = section.content.partition("### Sources")[0].rstrip()
+    sources = cited_sources(content, [doc_citation(doc) for doc in docs])
+
     # Append it to state
-    return {"sections": [section.content]}
+    return {
+        "sections": [{"analyst": analyst.name, "content": content, "sources": sources}]
+    }
 
 
 # Add nodes and edges
 interview_builder = StateGraph(InterviewState)
 interview_builder.add_node("ask_question", generate_question)
-interview_builder.add_node("search_web", search_web)
-interview_builder.add_node("search_wikipedia", search_wikipedia)
+interview_builder.add_node(
+    "search_sources", RunnableLambda(search_sources, afunc=asearch_sources)
+)
 interview_builder.add_node("answer_question", generate_answer)
 interview_builder.add_node("save_interview", save_interview)
 interview_builder.add_node("write_section", write_section)
 
 # Flow
 interview_builder.add_edge(START, "ask_question")
-interview_builder.add_edge("ask_question", "search_web")
-interview_builder.add_edge("ask_question", "search_wikipedia")
-interview_builder.add_edge("search_web", "answer_question")
-interview_builder.add_edge("search_wikipedia", "answer_question")
+interview_builder.add_conditional_edges(
+    "ask_question", route_question, ["search_sources", "save_interview"]
+)
+interview_builder.add_edge("search_sources", "answer_question")
 interview_builder.add_conditional_edges(
     "answer_question", route_messages, ["ask_question", "save_interview"]
 )
 interview_builder.add_edge("save_interview", "write_section")
 interview_builder.add_edge("write_section", END)
+interview_graph = interview_builder.compile()
+
+
+def interview_update(
+    state: InterviewState, interview: dict, queued_at: float, started_at: float
+) -> dict:
+    """Stream the finished section and return it with per-interview metrics"""
+
+    finished_at = time.perf_counter()
+
+    # Emit the section as soon as it is written
+    section = interview["sections"][0]
+    writer = get_stream_writer()
+    writer(
+        {
+            "analyst": section["analyst"],
+            "section": section["content"],
+            "sources": section["sources"],
+        }
+    )
+
+    # Write the section and per-interview metrics to the outer state
+    return {
+        "sections": interview["sections"],
+        "search_cache_hits": interview["search_cache_hits"],
+        "search_cache_misses": interview["search_cache_misses"],
+        "interview_metrics": [
+            {
+                "analyst": state["analyst"].name,
+                "queue_wait": started_at - queued_at,
+                "run_time": finished_at - started_at,
+            }
+        ],
+    }
+
+
+def conduct_interview(state: InterviewState, config: RunnableConfig):
+    """Run an interview once a dispatch slot is free"""
+
+    # Wait for a slot
+    queued_at = time.perf_counter()
+    with interview_slot(
+        state.get("dispatch_id"), state.get("max_concurrent_interviews")
+    ):
+        started_at = time.perf_counter()
+        interview = interview_graph.invoke(state, config)
+
+    return interview_update(state, interview, queued_at, started_at)
+
+
+async def aconduct_interview(state: InterviewState, config: RunnableConfig):
+    """Run an interview once a dispatch slot is free"""
+
+    # Wait for a slot
+    queued_at = time.perf_counter()
+    async with ainterview_slot(
+        state.get("dispatch_id"), state.get("max_concurrent_interviews")
+    ):
+        started_at = time.perf_counter()
+        interview = await interview_graph.ainvoke(state, config)
+
+    return interview_update(state, interview, queued_at, started_at)
 
 
 def initiate_all_interviews(state: ResearchGraphState):
@@ -415,6 +609,7 @@ def initiate_all_interviews(state: ResearchGraphState):
     # Otherwise kick off interviews in parallel via Send() API
     else:
         topic = state["topic"]
+        dispatch_id = str(uuid.uuid4())
         return [
             Send(
                 "conduct_interview",
@@ -425,12 +620,41 @@ def initiate_all_interviews(state: ResearchGraphState):
                             content=f"So you said you were writing an article on {topic}?"
                         )
                     ],
+                    "max_num_turns": state.get("max_num_turns", 2),
+                    "rate_limits": state.get("rate_limits", {}),
+                    "max_concurrent_interviews": state.get(
+                        "max_concurrent_interviews", 0
+                    ),
+                    "dispatch_id": dispatch_id,
                 },
             )
             for analyst in state["analysts"]
         ]
 
 
+def digest_sections(state: ResearchGraphState):
+    """Join the sections once for all of the report writers"""
+
+    # Full set of sections
+    sections = state["sections"]
+
+    # Number the sources cited across all sections, without repeats
+    citation_index = CitationIndex()
+
+    # Concat all sections together, with citations renumbered to match
+    formatted_str_sections = "\n\n".join(
+        [citation_index.renumber(section) for section in sections]
+    )
+
+    return {
+        "section_digest": {
+            "text": formatted_str_sections,
+            "citations": citation_index.sources,
+            "tokens": approximate_tokens(formatted_str_sections),
+        }
+    }
+
+
 # Write a report based on the interviews
 report_writer_instructions = """You are a technical writer creating a report on this overall topic: 
 
@@ -456,11 +680,7 @@ To format your report:
 4. Start your report with a single title header: ## Insights
 5. Do not mention any analyst names in your report.
 6. Preserve any citations in the memos, which will be annotated in brackets, for example [1] or [2].
-7. Create a final, consolidated list of sources and add to a Sources section with the `## Sources` header.
-8. List your sources in order and do not repeat.
-
-[1] Source 1
-[2] Source 2
+7. Do not add a Sources section. The consolidated list of sources is added to the report separately.
 
 Here are the memos from your analysts to build your report from: 
 
@@ -470,13 +690,10 @@ Here are the memos from your analysts to build your report from:
 def write_report(state: ResearchGraphState):
     """Node to write the final report body"""
 
-    # Full set of sections
-    sections = state["sections"]
+    # Sections, joined once by digest_sections
+    formatted_str_sections = state["section_digest"]["text"]
     topic = state["topic"]
 
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-
     # Summarize the sections into a final report
     system_message = report_writer_instructions.format(
         topic=topic, context=formatted_str_sections
@@ -515,13 +732,10 @@ Here are the sections to reflect on for writing: {formatted_str_sections}"""
 def write_introduction(state: ResearchGraphState):
     """Node to write the introduction"""
 
-    # Full set of sections
-    sections = state["sections"]
+    # Sections, joined once by digest_sections
+    formatted_str_sections = state["section_digest"]["text"]
     topic = state["topic"]
 
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-
     # Summarize the sections into a final report
 
     instructions = intro_conclusion_instructions.format(
@@ -536,13 +750,10 @@ def write_introduction(state: ResearchGraphState):
 def write_conclusion(state: ResearchGraphState):
     """Node to write the conclusion"""
 
-    # Full set of sections
-    sections = state["sections"]
+    # Sections, joined once by digest_sections
+    formatted_str_sections = state["section_digest"]["text"]
     topic = state["topic"]
 
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-
     # Summarize the sections into a final report
 
     instructions = intro_conclusion_instructions.format(
@@ -554,21 +765,45 @@ def write_conclusion(state: ResearchGraphState):
     return {"conclusion": conclusion.content}
 
 
+def write_introduction_and_conclusion(state: ResearchGraphState):
+    """Node to write the introduction and conclusion in one call"""
+
+    # Sections, joined once by digest_sections
+    formatted_str_sections = state["section_digest"]["text"]
+    topic = state["topic"]
+
+    # Enforce structured output
+    structured_llm = llm.with_structured_output(IntroductionConclusion)
+
+    instructions = intro_conclusion_instructions.format(
+        topic=topic, formatted_str_sections=formatted_str_sections
+    )
+    sections = structured_llm.invoke(
+        [instructions]
+        + [HumanMessage(content="Write both the report introduction and conclusion")]
+    )
+    return {"introduction": sections.introduction, "conclusion": sections.conclusion}
+
+
+def initiate_report_writers(state: ResearchGraphState, config: RunnableConfig):
+    """Conditional edge to start the report writers once the sections are digested"""
+
+    # Sending long sections to two writers costs more than one combined call
+    configurable = configuration.Configuration.from_runnable_config(config)
+    if (
+        state.get("combine_intro_conclusion")
+        or state["section_digest"]["tokens"]
+        > configurable.combine_intro_conclusion_tokens
+    ):
+        return ["write_report", "write_introduction_and_conclusion"]
+    return ["write_report", "write_introduction", "write_conclusion"]
+
+
 def finalize_report(state: ResearchGraphState):
     """The is the "reduce" step where we gather all the sections, combine them, and reflect on them to write the intro/conclusion"""
 
     # Save full final report
-    content = state["content"]
-    if content.startswith("## Insights"):
-        content = content.strip("## Insights")
-    if "## Sources" in content:
-        try:
-            content, sources = content.split("\n## Sources\n")
-        except:
-            sources = None
-    else:
-        sources = None
-
+    content = state["content"].removeprefix("## Insights").strip()
     final_report = (
         state["introduction"]
         + "\n\n---\n\n"
@@ -576,20 +811,27 @@ def finalize_report(state: ResearchGraphState):
         + "\n\n---\n\n"
         + state["conclusion"]
     )
-    if sources is not None:
-        final_report += "\n\n## Sources\n" + sources
+
+    # Sources are numbered by the citation index built in digest_sections
+    citations = state["section_digest"]["citations"]
+    if citations:
+        final_report += "\n\n" + format_sources(citations)
     return {"final_report": final_report}
 
 
 # Add nodes and edges
-builder = StateGraph(ResearchGraphState)
+builder = StateGraph(ResearchGraphState, config_schema=configuration.Configuration)
 builder.add_node("create_analysts", create_analysts)
 builder.add_node("human_feedback", human_feedback)
-builder.add_node("conduct_interview", interview_builder.compile())
+builder.add_node(
+    "conduct_interview", RunnableLambda(conduct_interview, afunc=aconduct_interview)
+)
+builder.add_node("digest_sections", digest_sections)
 builder.add_node("write_report", write_report)
 builder.add_node("write_introduction", write_introduction)
 builder.add_node("write_conclusion", write_conclusion)
-builder.add_node("finalize_report", finalize_report)
+builder.add_node("write_introduction_and_conclusion", write_introduction_and_conclusion)
+builder.add_node("finalize_report", finalize_report, defer=True)
 
 # Logic
 builder.add_edge(START, "create_analysts")
@@ -597,13 +839,72 @@ builder.add_edge("create_analysts", "human_feedback")
 builder.add_conditional_edges(
     "human_feedback", initiate_all_interviews, ["create_analysts", "conduct_interview"]
 )
-builder.add_edge("conduct_interview", "write_report")
-builder.add_edge("conduct_interview", "write_introduction")
-builder.add_edge("conduct_interview", "write_conclusion")
-builder.add_edge(
-    ["write_conclusion", "write_report", "write_introduction"], "finalize_report"
+builder.add_edge("conduct_interview", "digest_sections")
+builder.add_conditional_edges(
+    "digest_sections",
+    initiate_report_writers,
+    [
+        "write_report",
+        "write_introduction",
+        "write_conclusion",
+        "write_introduction_and_conclusion",
+    ],
 )
+builder.add_edge("write_report", "finalize_report")
+builder.add_edge("write_introduction", "finalize_report")
+builder.add_edge("write_conclusion", "finalize_report")
+builder.add_edge("write_introduction_and_conclusion", "finalize_report")
 builder.add_edge("finalize_report", END)
 
 # Compile
 graph = builder.compile(interrupt_before=["human_feedback"])
+
+
+@asynccontextmanager
+async def resumable_graph(path: str = "research_checkpoints.db"):
+    """Compile the graph with a durable SQLite checkpointer.
+
+    Interviews that finish are checkpointed even if another interview in the
+    same fan-out fails, so re-invoking the graph with None on the same thread
+    only re-runs the interviews that failed.
+    """
+
+    async with AsyncSqliteSaver.from_conn_string(path) as checkpointer:
+        yield builder.compile(
+            checkpointer=checkpointer, interrupt_before=["human_feedback"]
+        )
+
+
+async def astream_report(input, config: RunnableConfig, graph=graph):
+    """Stream report sections as each interview finishes, then the final report.
+
+    Yields {"analyst", "section", "sources", "draft"} for every finished
+    section, where "draft" is the report assembled from the sections so far,
+    and finally {"final_report"}. Citations in the section and the draft are
+    renumbered across sections, and the draft ends with the matching Sources
+    block. Pass None as the input to resume a thread that was interrupted
+    before human_feedback.
+    """
+
+    # Number the sources cited across the streamed sections, without repeats
+    citation_index = CitationIndex()
+    sections = []
+    async for mode, chunk in graph.astream(
+        input, config, stream_mode=["custom", "values"]
+    ):
+        if mode == "custom" and "section" in chunk:
+            section = citation_index.renumber(
+                {"content": chunk["section"], "sources": chunk["sources"]}
+            )
+            sections.append(section)
+            draft = "\n\n".join(sections)
+            if citation_index.sources:
+                draft += "\n\n" + format_sources(citation_index.sources)
+            yield {
+                "analyst": chunk["analyst"],
+                "section": section,
+                "sources": [citation["source"] for citation in chunk["sources"]],
+                "draft": draft,
+            }
+        elif mode == "values" and chunk.get("final_report"):
+            yield {"final_report": chunk["final_report"]}
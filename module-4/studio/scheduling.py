@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from functools import cache
+from typing import Optional
+from weakref import WeakValueDictionary
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+# Semaphores for in-flight dispatches (sync and async runs), dropped once no
+# interview holds them
+_interview_slots: "WeakValueDictionary[str, threading.Semaphore]" = (
+    WeakValueDictionary()
+)
+_ainterview_slots: "WeakValueDictionary[str, asyncio.Semaphore]" = WeakValueDictionary()
+_slots_lock = threading.Lock()
+
+
+@cache
+def get_rate_limiter(provider: str, requests_per_second: float) -> InMemoryRateLimiter:
+    """Share one token bucket per provider and rate across the process"""
+    return InMemoryRateLimiter(
+        requests_per_second=requests_per_second,
+        check_every_n_seconds=0.05,
+        max_bucket_size=max(1.0, requests_per_second),
+    )
+
+
+def throttle(rate_limits: Optional[dict], provider: str) -> None:
+    """Block until the provider's token bucket allows another request"""
+    if rate_limits and rate_limits.get(provider):
+        get_rate_limiter(provider, float(rate_limits[provider])).acquire()
+
+
+async def athrottle(rate_limits: Optional[dict], provider: str) -> None:
+    """Wait until the provider's token bucket allows another request"""
+    if rate_limits and rate_limits.get(provider):
+        await get_rate_limiter(provider, float(rate_limits[provider])).aacquire()
+
+
+@contextmanager
+def interview_slot(dispatch_id: Optional[str], limit: Optional[int]):
+    """Hold one of `limit` slots shared by all interviews of a dispatch"""
+    if not dispatch_id or not limit:
+        yield
+        return
+    with _slots_lock:
+        semaphore = _interview_slots.get(dispatch_id)
+        if semaphore is None:
+            semaphore = _interview_slots[dispatch_id] = threading.Semaphore(limit)
+    with semaphore:
+        yield
+
+
+@asynccontextmanager
+async def ainterview_slot(dispatch_id: Optional[str], limit: Optional[int]):
+    """Hold one of `limit` slots shared by all interviews of a dispatch"""
+    if not dispatch_id or not limit:
+        yield
+        return
+    semaphore = _ainterview_slots.get(dispatch_id)
+    if semaphore is None:
+        semaphore = _ainterview_slots[dispatch_id] = asyncio.Semaphore(limit)
+    async with semaphore:
+        yield
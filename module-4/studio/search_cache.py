@@ -0,0 +1,118 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from functools import cache
+from typing import Optional
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text so that near-identical queries share a cache entry"""
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+
+class SearchCache:
+    """Persistent search result cache keyed by source and normalized query.
+
+    Entries expire after `ttl` seconds and the least recently used entries are
+    evicted once the cache holds more than `max_entries`. In offline mode the
+    cache acts as a fixture store: expired entries are still served and misses
+    never reach the network.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS search_cache (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                query TEXT NOT NULL,
+                docs TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(source: str, query: str) -> str:
+        """Content address of a search"""
+        return hashlib.sha256(
+            f"{source}\x00{normalize_query(query)}".encode()
+        ).hexdigest()
+
+    def get(
+        self, source: str, query: str, allow_expired: bool = False
+    ) -> Optional[list]:
+        """Return the cached docs for a search, or None on a miss"""
+        key = self.key(source, query)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT docs, created_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            docs, created_at = row
+            if not allow_expired and now - created_at > self.ttl:
+                return None
+            self._conn.execute(
+                "UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+        return json.loads(docs)
+
+    def put(self, source: str, query: str, docs: list) -> None:
+        """Store the docs for a search and enforce the TTL and size bounds"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self.key(source, query),
+                    source,
+                    normalize_query(query),
+                    json.dumps(docs),
+                    now,
+                    now,
+                ),
+            )
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE created_at < ?", (now - self.ttl,)
+            )
+            self._conn.execute(
+                """DELETE FROM search_cache WHERE key NOT IN (
+                    SELECT key FROM search_cache ORDER BY accessed_at DESC LIMIT ?
+                )""",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def fetch(
+        self,
+        source: str,
+        query: str,
+        search: Callable[[str], list],
+        offline: bool = False,
+    ) -> tuple[list, bool]:
+        """Return (docs, hit), running `search` on a miss unless offline"""
+        docs = self.get(source, query, allow_expired=offline)
+        if docs is not None:
+            return docs, True
+        if offline:
+            return [], False
+        docs = search(query)
+        self.put(source, query, docs)
+        return docs, False
+
+
+@cache
+def get_search_cache(path: str, ttl: float, max_entries: int) -> SearchCache:
+    """Share one cache per database file across nodes and runs"""
+    return SearchCache(path, ttl, max_entries)
@@ -1,27 +1,78 @@
 import os
 from dataclasses import dataclass, fields
+from functools import lru_cache
 from typing import Any, Optional
 
 from langchain_core.runnables import RunnableConfig
 
 
-@dataclass(kw_only=True)
+def _coerce(value: Any, default: Any) -> Any:
+    """Coerce string values (e.g. from environment variables) to the type of the default."""
+    if not isinstance(value, str) or isinstance(default, str):
+        return value
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+@dataclass(kw_only=True, frozen=True, slots=True)
 class Configuration:
     """The configurable fields for the chatbot."""
 
     user_id: str = "default-user"
 
+    # Memory retrieval
+    memory_top_k: int = 10  # Memories retrieved per prompt by relevance
+    memory_full_scan_threshold: int = 20  # Smaller collections are read whole
+
+    # Memory extraction
+    extraction_turns: int = 1  # User turns to accumulate before extracting
+    extraction_interval: float = 300.0  # Seconds after which held turns are extracted
+
+    # Memory writes
+    deferred_memory_writes: bool = False  # Write memories in a background worker
+    memory_queue_path: str = "memory_queue.db"
+    memory_write_delay: float = 2.0  # Seconds to wait for more turns to coalesce
+
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
     ) -> "Configuration":
-        """Create a Configuration instance from a RunnableConfig."""
+        """Create a Configuration instance from a RunnableConfig.
+
+        Instances are cached by the values of the configurable fields, so
+        resolving a configuration seen before is a dictionary lookup.
+        """
         configurable = (
             config["configurable"] if config and "configurable" in config else {}
         )
-        values: dict[str, Any] = {
-            f.name: os.environ.get(f.name.upper(), configurable.get(f.name))
-            for f in fields(cls)
-            if f.init
-        }
-        return cls(**{k: v for k, v in values.items() if v})
+        values = tuple(configurable.get(name) for name in _FIELDS)
+        try:
+            hash(values)
+        except TypeError:
+            # Unhashable values can't key the cache, so resolve them directly
+            return _resolve.__wrapped__(values)
+        return _resolve(values)
+
+
+# Configurable field names, and the environment variables that override them.
+# The environment is read once at startup rather than on every resolution.
+_FIELDS = tuple(f.name for f in fields(Configuration) if f.init)
+_ENVIRONMENT = {name: os.environ.get(name.upper()) for name in _FIELDS}
+_DEFAULTS = {f.name: f.default for f in fields(Configuration) if f.init}
+
+
+@lru_cache(maxsize=256)
+def _resolve(values: tuple) -> Configuration:
+    """Build a Configuration from configurable values and environment overrides."""
+    resolved = {}
+    for name, value in zip(_FIELDS, values):
+        if _ENVIRONMENT[name] is not None:
+            value = _ENVIRONMENT[name]
+        if value:
+            resolved[name] = _coerce(value, _DEFAULTS[name])
+    return Configuration(**resolved)
@@ -0,0 +1,79 @@
+import time
+from typing import Any
+
+from langchain_core.messages import AnyMessage, HumanMessage
+from langgraph.graph import MessagesState
+from langgraph.store.base import BaseStore
+
+from memory_queue import MemoryWriteQueue, MemoryWriter
+
+
+class ExtractionState(MessagesState):
+    last_extracted: int  # Number of messages already passed to extraction or held
+    held_turns: int  # User turns held in the memory queue for a timed extraction
+    held_at: float  # Time the first held turn was queued
+
+
+def new_messages(state: ExtractionState) -> list[AnyMessage]:
+    """Messages added since the last extraction."""
+    return state["messages"][state.get("last_extracted", 0) :]
+
+
+def pending_turns(state: ExtractionState, interval: float) -> int:
+    """User turns awaiting extraction, counting held turns until their flush is due."""
+    turns = sum(isinstance(message, HumanMessage) for message in new_messages(state))
+    if time.time() - state.get("held_at", 0.0) < interval:
+        turns += state.get("held_turns", 0)
+    return turns
+
+
+def extraction_due(state: ExtractionState, turns: int, interval: float) -> bool:
+    """Whether at least `turns` user turns await extraction."""
+    return pending_turns(state, interval) >= turns
+
+
+def mark_extracted(state: ExtractionState) -> dict:
+    """State update recording that every current message has been extracted."""
+    return {"last_extracted": len(state["messages"]), "held_turns": 0, "held_at": 0.0}
+
+
+def hold_messages(
+    state: ExtractionState,
+    queue: MemoryWriteQueue,
+    graph: str,
+    writer: MemoryWriter,
+    store: BaseStore,
+    configurable: Any,
+    thread_id: str,
+) -> dict:
+    """Queue the new messages to be extracted `extraction_interval` seconds after the first held turn.
+
+    The queue merges every held turn of the conversation into one job, so
+    held turns are written once even if the user never sends another turn.
+    """
+    interval = configurable.extraction_interval
+    held = time.time() - state.get("held_at", 0.0) < interval
+    queue.enqueue(
+        graph, writer, store, configurable, thread_id, new_messages(state), interval
+    )
+    return {
+        "last_extracted": len(state["messages"]),
+        "held_turns": pending_turns(state, interval),
+        "held_at": state["held_at"] if held else time.time(),
+    }
+
+
+def held_messages(
+    state: ExtractionState,
+    queue: MemoryWriteQueue,
+    graph: str,
+    configurable: Any,
+    thread_id: str,
+) -> list[AnyMessage]:
+    """Take held turns out of the queue to extract them with the new messages.
+
+    Held turns whose flush already ran are no longer queued and are skipped.
+    """
+    if not state.get("held_turns"):
+        return []
+    return queue.take(graph, configurable.user_id, thread_id)
@@ -1,40 +1,39 @@
-import uuid
 from datetime import datetime
 
 from pydantic import BaseModel, Field
 
 from trustcall import create_extractor
 
-from typing import Literal, Optional, TypedDict
+from typing import Annotated, Literal, Optional, TypedDict
 
 from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import merge_configs
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.messages import merge_message_runs
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import AIMessage, SystemMessage, HumanMessage
+from langchain_core.outputs import LLMResult
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.graph import StateGraph, MessagesState, START, END
 from langgraph.store.base import BaseStore
 
 import configuration
+from store_writes import put_all, response_puts
 
 ## Utilities
 
 
-# Inspect the tool calls for Trustcall
-class Spy:
+# Capture the tool calls made by Trustcall as its model calls finish
+class ToolCallCapture(BaseCallbackHandler):
     def __init__(self):
         self.called_tools = []
 
-    def __call__(self, run):
-        q = [run]
-        while q:
-            r = q.pop()
-            if r.child_runs:
-                q.extend(r.child_runs)
-            if r.run_type == "chat_model":
-                self.called_tools.append(
-                    r.outputs["generations"][0][0]["message"]["kwargs"]["tool_calls"]
-                )
+    def on_llm_end(self, response: LLMResult, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if isinstance(message, AIMessage):
+                    self.called_tools.append(message.tool_calls)
 
 
 # Extract information from tool calls for both patches and new memories in Trustcall
@@ -204,6 +203,38 @@ Your current instructions are:
 {current_instructions}
 </current_instructions>"""
 
+## Graph state
+
+
+# Reducer that merges the extraction marks of each memory type
+def merge_extracted(existing: dict, new: dict) -> dict:
+    return {**existing, **new}
+
+
+class State(MessagesState):
+    # Number of messages already passed to the extractor, per memory type
+    extracted: Annotated[dict[str, int], merge_extracted]
+
+
+def extraction_window(state: State, memory_type: str) -> list:
+    """Messages since the last extraction of a memory type, excluding the tool call.
+
+    The window opens on a user turn so it never starts with an orphaned tool
+    result, and always includes the latest user turn.
+    """
+    messages = state["messages"]
+    start = state.get("extracted", {}).get(memory_type, 0)
+    # Scan back from the message before the tool call, so the cost is
+    # proportional to the window, and slice only the window
+    window_start = None
+    for i in range(len(messages) - 2, -1, -1):
+        if i < start and window_start is not None:
+            break
+        if isinstance(messages[i], HumanMessage):
+            window_start = i
+    return messages[window_start or 0 : -1]
+
+
 ## Node definitions
 
 
@@ -247,7 +278,7 @@ def task_mAIstro(state: MessagesState, config: RunnableConfig, store: BaseStore)
     return {"messages": [response]}
 
 
-def update_profile(state: MessagesState, config: RunnableConfig, store: BaseStore):
+def update_profile(state: State, config: RunnableConfig, store: BaseStore):
     """Reflect on the chat history and update the memory collection."""
 
     # Get the user ID from the config
@@ -271,14 +302,14 @@ def update_profile(state: MessagesState, config: RunnableConfig, store: BaseStor
         else None
     )
 
-    # Merge the chat history and the instruction
+    # Merge the messages since the last extraction and the instruction
     TRUSTCALL_INSTRUCTION_FORMATTED = TRUSTCALL_INSTRUCTION.format(
         time=datetime.now().isoformat()
     )
     updated_messages = list(
         merge_message_runs(
             messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)]
-            + state["messages"][:-1]
+            + extraction_window(state, "user")
         )
     )
 
@@ -288,12 +319,7 @@ def update_profile(state: MessagesState, config: RunnableConfig, store: BaseStor
     )
 
     # Save save the memories from Trustcall to the store
-    for r, rmeta in zip(result["responses"], result["response_metadata"]):
-        store.put(
-            namespace,
-            rmeta.get("json_doc_id", str(uuid.uuid4())),
-            r.model_dump(mode="json"),
-        )
+    put_all(store, response_puts(namespace, result))
     tool_calls = state["messages"][-1].tool_calls
     # Return tool message with update verification
     return {
@@ -303,11 +329,12 @@ def update_profile(state: MessagesState, config: RunnableConfig, store: BaseStor
                 "content": "updated profile",
                 "tool_call_id": tool_calls[0]["id"],
             }
-        ]
+        ],
+        "extracted": {"user": len(state["messages"])},
     }
 
 
-def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore):
+def update_todos(state: State, config: RunnableConfig, store: BaseStore):
     """Reflect on the chat history and update the memory collection."""
 
     # Get the user ID from the config
@@ -331,43 +358,39 @@ def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore)
         else None
     )
 
-    # Merge the chat history and the instruction
+    # Merge the messages since the last extraction and the instruction
     TRUSTCALL_INSTRUCTION_FORMATTED = TRUSTCALL_INSTRUCTION.format(
         time=datetime.now().isoformat()
     )
     updated_messages = list(
         merge_message_runs(
             messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)]
-            + state["messages"][:-1]
+            + extraction_window(state, "todo")
         )
     )
 
-    # Initialize the spy for visibility into the tool calls made by Trustcall
-    spy = Spy()
+    # Capture the tool calls made by Trustcall to report the changes
+    capture = ToolCallCapture()
 
     # Create the Trustcall extractor for updating the ToDo list
     todo_extractor = create_extractor(
         llm, tools=[ToDo], tool_choice=tool_name, enable_inserts=True
-    ).with_listeners(on_end=spy)
+    )
 
     # Invoke the extractor
     result = todo_extractor.invoke(
-        {"messages": updated_messages, "existing": existing_memories}
+        {"messages": updated_messages, "existing": existing_memories},
+        merge_configs(config, {"callbacks": [capture]}),
     )
 
     # Save save the memories from Trustcall to the store
-    for r, rmeta in zip(result["responses"], result["response_metadata"]):
-        store.put(
-            namespace,
-            rmeta.get("json_doc_id", str(uuid.uuid4())),
-            r.model_dump(mode="json"),
-        )
+    put_all(store, response_puts(namespace, result))
 
     # Respond to the tool call made in task_mAIstro, confirming the update
     tool_calls = state["messages"][-1].tool_calls
 
     # Extract the changes made by Trustcall and add the the ToolMessage returned to task_mAIstro
-    todo_update_msg = extract_tool_info(spy.called_tools, tool_name)
+    todo_update_msg = extract_tool_info(capture.called_tools, tool_name)
     return {
         "messages": [
             {
@@ -375,7 +398,8 @@ def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore)
                 "content": todo_update_msg,
                 "tool_call_id": tool_calls[0]["id"],
             }
-        ]
+        ],
+        "extracted": {"todo": len(state["messages"])},
     }
 
 
@@ -441,7 +465,7 @@ def route_message(
 
 
 # Create the graph + all nodes
-builder = StateGraph(MessagesState, config_schema=configuration.Configuration)
+builder = StateGraph(State, config_schema=configuration.Configuration)
 
 # Define the flow of the memory extraction process
 builder.add_node(task_mAIstro)
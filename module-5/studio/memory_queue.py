@@ -0,0 +1,201 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict
+from functools import cache
+from typing import Any, Optional
+
+from langchain_core.messages import AnyMessage, messages_from_dict, messages_to_dict
+from langchain_core.runnables import RunnableConfig
+from langgraph.store.base import BaseStore
+
+logger = logging.getLogger(__name__)
+
+# Writes memories for the configured user from a chat history
+MemoryWriter = Callable[[BaseStore, RunnableConfig, list[AnyMessage]], None]
+
+
+class MemoryWriteQueue:
+    """Persistent queue of memory writes, drained by a background worker.
+
+    Jobs are keyed by graph, user and thread. Enqueuing a write for a
+    conversation that already has one pending merges the new messages into it,
+    so a burst of turns costs a single reflection, and the merged job runs at
+    the earlier of the two scheduled times. A job is only
+    removed once its writer succeeds, and jobs left over from a previous process
+    run again once their graph enqueues a new write, so every write is applied
+    at least once.
+    """
+
+    def __init__(self, path: str, delay: float = 0.0, max_backoff: float = 60.0):
+        self.delay = delay
+        self.max_backoff = max_backoff
+        self._writers: dict[str, tuple[MemoryWriter, BaseStore]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker: Optional[threading.Thread] = None
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS memory_writes (
+                graph TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                thread_id TEXT NOT NULL,
+                configurable TEXT NOT NULL,
+                messages TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                attempts INTEGER NOT NULL,
+                run_at REAL NOT NULL,
+                PRIMARY KEY (graph, user_id, thread_id)
+            )"""
+        )
+        self._conn.commit()
+
+    def enqueue(
+        self,
+        graph: str,
+        writer: MemoryWriter,
+        store: BaseStore,
+        configurable: Any,
+        thread_id: str,
+        messages: list[AnyMessage],
+        delay: Optional[float] = None,
+    ) -> None:
+        """Queue a memory write, merging it into any pending write for the conversation
+
+        `configurable` is the run's Configuration; it is passed back to the
+        writer as the configurable of a RunnableConfig. The write runs after
+        `delay` seconds, or the queue's delay if not given.
+        """
+        delay = self.delay if delay is None else delay
+        with self._wakeup:
+            self._writers[graph] = (writer, store)
+            key = (graph, configurable.user_id, thread_id)
+            row = self._conn.execute(
+                """SELECT messages FROM memory_writes
+                WHERE graph = ? AND user_id = ? AND thread_id = ?""",
+                key,
+            ).fetchone()
+            if row:
+                # Keep pending messages, adding new ones unless already queued
+                pending = messages_from_dict(json.loads(row[0]))
+                queued = {message.id for message in pending if message.id}
+                messages = pending + [
+                    message for message in messages if message.id not in queued
+                ]
+            self._conn.execute(
+                """INSERT INTO memory_writes VALUES (?, ?, ?, ?, ?, 1, 0, ?)
+                ON CONFLICT (graph, user_id, thread_id) DO UPDATE SET
+                    configurable = excluded.configurable,
+                    messages = excluded.messages,
+                    version = version + 1,
+                    attempts = 0,
+                    run_at = MIN(run_at, excluded.run_at)""",
+                (
+                    *key,
+                    json.dumps(asdict(configurable)),
+                    json.dumps(messages_to_dict(messages)),
+                    time.time() + delay,
+                ),
+            )
+            self._conn.commit()
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._work, name="memory-writes", daemon=True
+                )
+                self._worker.start()
+            self._wakeup.notify()
+
+    def take(self, graph: str, user_id: str, thread_id: str) -> list[AnyMessage]:
+        """Remove a conversation's pending write, returning its messages to write now"""
+        with self._lock:
+            key = (graph, user_id, thread_id)
+            row = self._conn.execute(
+                """SELECT messages FROM memory_writes
+                WHERE graph = ? AND user_id = ? AND thread_id = ?""",
+                key,
+            ).fetchone()
+            if row is None:
+                return []
+            self._conn.execute(
+                """DELETE FROM memory_writes
+                WHERE graph = ? AND user_id = ? AND thread_id = ?""",
+                key,
+            )
+            self._conn.commit()
+            return messages_from_dict(json.loads(row[0]))
+
+    def pending(self) -> int:
+        """Number of writes queued or in progress"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM memory_writes").fetchone()[
+                0
+            ]
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued write is applied; False on timeout"""
+        deadline = None if timeout is None else time.time() + timeout
+        while self.pending():
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _next_job(self) -> Optional[tuple]:
+        """Claim the next due job for a graph with a writer, waiting until one is due"""
+        with self._wakeup:
+            while True:
+                graphs = list(self._writers)
+                row = self._conn.execute(
+                    f"""SELECT graph, user_id, thread_id, configurable, messages, version, attempts, run_at
+                    FROM memory_writes WHERE graph IN ({",".join("?" * len(graphs))})
+                    ORDER BY run_at LIMIT 1""",
+                    graphs,
+                ).fetchone()
+                if row is None:
+                    self._wakeup.wait()
+                elif row[-1] > time.time():
+                    self._wakeup.wait(row[-1] - time.time())
+                else:
+                    return row
+
+    def _work(self) -> None:
+        while True:
+            graph, user_id, thread_id, configurable, messages, version, attempts, _ = (
+                self._next_job()
+            )
+            writer, store = self._writers[graph]
+            key = (graph, user_id, thread_id)
+            try:
+                writer(
+                    store,
+                    {"configurable": json.loads(configurable)},
+                    messages_from_dict(json.loads(messages)),
+                )
+            except Exception:
+                logger.exception("Memory write failed for %s, will retry", key)
+                backoff = min(self.max_backoff, 2.0**attempts)
+                with self._lock:
+                    self._conn.execute(
+                        """UPDATE memory_writes SET attempts = attempts + 1, run_at = ?
+                        WHERE graph = ? AND user_id = ? AND thread_id = ? AND version = ?""",
+                        (time.time() + backoff, *key, version),
+                    )
+                    self._conn.commit()
+                continue
+            # Keep the job if a newer history was queued while this one was written
+            with self._lock:
+                self._conn.execute(
+                    """DELETE FROM memory_writes
+                    WHERE graph = ? AND user_id = ? AND thread_id = ? AND version = ?""",
+                    (*key, version),
+                )
+                self._conn.commit()
+
+
+@cache
+def get_memory_queue(path: str, delay: float) -> MemoryWriteQueue:
+    """Share one queue and worker per database file across nodes and runs"""
+    return MemoryWriteQueue(path, delay)
@@ -1,9 +1,10 @@
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import AnyMessage, SystemMessage
 from langchain_core.runnables.config import RunnableConfig
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.graph import StateGraph, MessagesState, START, END
 from langgraph.store.base import BaseStore
 import configuration
+from memory_queue import get_memory_queue
 
 # Initialize the LLM
 llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
@@ -66,7 +67,7 @@ def call_model(state: MessagesState, config: RunnableConfig, store: BaseStore):
     return {"messages": response}
 
 
-def write_memory(state: MessagesState, config: RunnableConfig, store: BaseStore):
+def update_memory(store: BaseStore, config: RunnableConfig, messages: list[AnyMessage]):
     """Reflect on the chat history and save a memory to the store."""
 
     # Get configuration
@@ -88,13 +89,37 @@ def write_memory(state: MessagesState, config: RunnableConfig, store: BaseStore)
 
     # Format the memory in the system prompt
     system_msg = CREATE_MEMORY_INSTRUCTION.format(memory=existing_memory_content)
-    new_memory = llm.invoke([SystemMessage(content=system_msg)] + state["messages"])
+    new_memory = llm.invoke([SystemMessage(content=system_msg)] + messages)
 
     # Overwrite the existing memory in the store
     key = "user_memory"
     store.put(namespace, key, {"memory": new_memory.content})
 
 
+def write_memory(state: MessagesState, config: RunnableConfig, store: BaseStore):
+    """Save a memory now, or queue it for the background worker."""
+
+    # Get configuration
+    configurable = configuration.Configuration.from_runnable_config(config)
+
+    # Hand the write to the background worker so the run ends after the response
+    if configurable.deferred_memory_writes:
+        queue = get_memory_queue(
+            configurable.memory_queue_path, configurable.memory_write_delay
+        )
+        queue.enqueue(
+            "chatbot_memory",
+            update_memory,
+            store,
+            configurable,
+            config["configurable"].get("thread_id", ""),
+            state["messages"],
+        )
+        return
+
+    update_memory(store, config, state["messages"])
+
+
 # Define the graph
 builder = StateGraph(MessagesState, config_schema=configuration.Configuration)
 builder.add_node("call_model", call_model)
@@ -1,16 +1,27 @@
-import uuid
+from typing import Literal
 
 from pydantic import BaseModel, Field
 
 from trustcall import create_extractor
 
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import AnyMessage, SystemMessage
 from langchain_core.messages import merge_message_runs
 from langchain_core.runnables.config import RunnableConfig
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.graph import StateGraph, MessagesState, START, END
+from langgraph.graph import StateGraph, START, END
 from langgraph.store.base import BaseStore
 import configuration
+from extraction import (
+    ExtractionState,
+    extraction_due,
+    held_messages,
+    hold_messages,
+    mark_extracted,
+    new_messages,
+)
+from memory_index import recent_text, search_memories
+from memory_queue import get_memory_queue
+from store_writes import put_all, response_puts
 
 # Initialize the LLM
 model = ChatGoogleGenerativeAI(model="gpt-4o-mini", temperature=0)
@@ -49,7 +60,7 @@ Use the provided tools to retain any necessary memories about the user.
 Use parallel tool calling to handle updates and insertions simultaneously:"""
 
 
-def call_model(state: MessagesState, config: RunnableConfig, store: BaseStore):
+def call_model(state: ExtractionState, config: RunnableConfig, store: BaseStore):
     """Load memory from the store and use it to personalize the chatbot's response."""
 
     # Get configuration
@@ -58,9 +69,15 @@ def call_model(state: MessagesState, config: RunnableConfig, store: BaseStore):
     # Get the user ID from the config
     user_id = configurable.user_id
 
-    # Retrieve memory from the store
+    # Retrieve the memories most relevant to the conversation
     namespace = ("memories", user_id)
-    memories = store.search(namespace)
+    memories = search_memories(
+        store,
+        namespace,
+        recent_text(state["messages"]),
+        configurable.memory_top_k,
+        configurable.memory_full_scan_threshold,
+    )
 
     # Format the memories for the system prompt
     info = "\n".join(f"- {mem.value['content']}" for mem in memories)
@@ -72,8 +89,10 @@ def call_model(state: MessagesState, config: RunnableConfig, store: BaseStore):
     return {"messages": response}
 
 
-def write_memory(state: MessagesState, config: RunnableConfig, store: BaseStore):
-    """Reflect on the chat history and save a memory to the store."""
+def update_memories(
+    store: BaseStore, config: RunnableConfig, messages: list[AnyMessage]
+):
+    """Reflect on the chat history and save memories to the store."""
 
     # Get configuration
     configurable = configuration.Configuration.from_runnable_config(config)
@@ -84,8 +103,14 @@ def write_memory(state: MessagesState, config: RunnableConfig, store: BaseStore)
     # Define the namespace for the memories
     namespace = ("memories", user_id)
 
-    # Retrieve the most recent memories for context
-    existing_items = store.search(namespace)
+    # Retrieve the memories most relevant to the conversation for context
+    existing_items = search_memories(
+        store,
+        namespace,
+        recent_text(messages),
+        configurable.memory_top_k,
+        configurable.memory_full_scan_threshold,
+    )
 
     # Format the existing memories for the Trustcall extractor
     tool_name = "Memory"
@@ -101,7 +126,7 @@ def write_memory(state: MessagesState, config: RunnableConfig, store: BaseStore)
     # Merge the chat history and the instruction
     updated_messages = list(
         merge_message_runs(
-            messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION)] + state["messages"]
+            messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION)] + messages
         )
     )
 
@@ -111,19 +136,80 @@ def write_memory(state: MessagesState, config: RunnableConfig, store: BaseStore)
     )
 
     # Save the memories from Trustcall to the store
-    for r, rmeta in zip(result["responses"], result["response_metadata"]):
-        store.put(
-            namespace,
-            rmeta.get("json_doc_id", str(uuid.uuid4())),
-            r.model_dump(mode="json"),
+    put_all(store, response_puts(namespace, result))
+
+
+def write_memory(state: ExtractionState, config: RunnableConfig, store: BaseStore):
+    """Save memories from the messages since the last extraction, now or in the background."""
+
+    # Get configuration
+    configurable = configuration.Configuration.from_runnable_config(config)
+    thread_id = config["configurable"].get("thread_id", "")
+    queue = get_memory_queue(
+        configurable.memory_queue_path, configurable.memory_write_delay
+    )
+
+    # Hand the write to the background worker so the run ends after the response.
+    # The queue merges it with any held turns
+    if configurable.deferred_memory_writes:
+        queue.enqueue(
+            "chatbot_memory_collection",
+            update_memories,
+            store,
+            configurable,
+            thread_id,
+            new_messages(state),
         )
+        return mark_extracted(state)
+
+    # Write any held turns now, together with the new messages
+    messages = held_messages(
+        state, queue, "chatbot_memory_collection", configurable, thread_id
+    )
+    update_memories(store, config, messages + new_messages(state))
+    return mark_extracted(state)
+
+
+def hold_memory(state: ExtractionState, config: RunnableConfig, store: BaseStore):
+    """Hold the new turns in the queue until more turns arrive or the interval passes."""
+
+    # Get configuration
+    configurable = configuration.Configuration.from_runnable_config(config)
+    queue = get_memory_queue(
+        configurable.memory_queue_path, configurable.memory_write_delay
+    )
+    return hold_messages(
+        state,
+        queue,
+        "chatbot_memory_collection",
+        update_memories,
+        store,
+        configurable,
+        config["configurable"].get("thread_id", ""),
+    )
+
+
+def route_extraction(
+    state: ExtractionState, config: RunnableConfig
+) -> Literal["write_memory", "hold_memory", END]:
+    """Extract memories once enough new turns have accumulated, holding them until then."""
+    configurable = configuration.Configuration.from_runnable_config(config)
+    if extraction_due(
+        state, configurable.extraction_turns, configurable.extraction_interval
+    ):
+        return "write_memory"
+    if new_messages(state):
+        return "hold_memory"
+    return END
 
 
 # Define the graph
-builder = StateGraph(MessagesState, config_schema=configuration.Configuration)
+builder = StateGraph(ExtractionState, config_schema=configuration.Configuration)
 builder.add_node("call_model", call_model)
 builder.add_node("write_memory", write_memory)
+builder.add_node("hold_memory", hold_memory)
 builder.add_edge(START, "call_model")
-builder.add_edge("call_model", "write_memory")
+builder.add_conditional_edges("call_model", route_extraction)
 builder.add_edge("write_memory", END)
+builder.add_edge("hold_memory", END)
 graph = builder.compile()
@@ -1,13 +1,24 @@
+from typing import Literal
+
 from pydantic import BaseModel, Field
 
 from trustcall import create_extractor
 
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import AnyMessage, SystemMessage
 from langchain_core.runnables.config import RunnableConfig
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.graph import StateGraph, MessagesState, START, END
+from langgraph.graph import StateGraph, START, END
 from langgraph.store.base import BaseStore
 import configuration
+from extraction import (
+    ExtractionState,
+    extraction_due,
+    held_messages,
+    hold_messages,
+    mark_extracted,
+    new_messages,
+)
+from memory_queue import get_memory_queue
 
 # Initialize the LLM
 model = ChatGoogleGenerativeAI(model="gpt-4o-mini", temperature=0)
@@ -38,7 +49,7 @@ Here is the memory (it may be empty): {memory}"""
 TRUSTCALL_INSTRUCTION = """Create or update the memory (JSON doc) to incorporate information from the following conversation:"""
 
 
-def call_model(state: MessagesState, config: RunnableConfig, store: BaseStore):
+def call_model(state: ExtractionState, config: RunnableConfig, store: BaseStore):
     """Load memory from the store and use it to personalize the chatbot's response."""
 
     # Get configuration
@@ -71,8 +82,10 @@ def call_model(state: MessagesState, config: RunnableConfig, store: BaseStore):
     return {"messages": response}
 
 
-def write_memory(state: MessagesState, config: RunnableConfig, store: BaseStore):
-    """Reflect on the chat history and save a memory to the store."""
+def update_profile(
+    store: BaseStore, config: RunnableConfig, messages: list[AnyMessage]
+):
+    """Reflect on the messages and save the updated profile to the store."""
 
     # Get configuration
     configurable = configuration.Configuration.from_runnable_config(config)
@@ -89,11 +102,10 @@ def write_memory(state: MessagesState, config: RunnableConfig, store: BaseStore)
         {"UserProfile": existing_memory.value} if existing_memory else None
     )
 
-    # Invoke the extractor
+    # Invoke the extractor on the given messages only
     result = trustcall_extractor.invoke(
         {
-            "messages": [SystemMessage(content=TRUSTCALL_INSTRUCTION)]
-            + state["messages"],
+            "messages": [SystemMessage(content=TRUSTCALL_INSTRUCTION)] + messages,
             "existing": existing_profile,
         }
     )
@@ -106,11 +118,67 @@ def write_memory(state: MessagesState, config: RunnableConfig, store: BaseStore)
     store.put(namespace, key, updated_profile)
 
 
+def write_memory(state: ExtractionState, config: RunnableConfig, store: BaseStore):
+    """Reflect on the messages since the last extraction and save a memory to the store."""
+
+    # Get configuration
+    configurable = configuration.Configuration.from_runnable_config(config)
+    queue = get_memory_queue(
+        configurable.memory_queue_path, configurable.memory_write_delay
+    )
+
+    # Write any held turns now, together with the new messages
+    messages = held_messages(
+        state,
+        queue,
+        "chatbot_memory_profile",
+        configurable,
+        config["configurable"].get("thread_id", ""),
+    )
+    update_profile(store, config, messages + new_messages(state))
+    return mark_extracted(state)
+
+
+def hold_memory(state: ExtractionState, config: RunnableConfig, store: BaseStore):
+    """Hold the new turns in the queue until more turns arrive or the interval passes."""
+
+    # Get configuration
+    configurable = configuration.Configuration.from_runnable_config(config)
+    queue = get_memory_queue(
+        configurable.memory_queue_path, configurable.memory_write_delay
+    )
+    return hold_messages(
+        state,
+        queue,
+        "chatbot_memory_profile",
+        update_profile,
+        store,
+        configurable,
+        config["configurable"].get("thread_id", ""),
+    )
+
+
+def route_extraction(
+    state: ExtractionState, config: RunnableConfig
+) -> Literal["write_memory", "hold_memory", END]:
+    """Extract memories once enough new turns have accumulated, holding them until then."""
+    configurable = configuration.Configuration.from_runnable_config(config)
+    if extraction_due(
+        state, configurable.extraction_turns, configurable.extraction_interval
+    ):
+        return "write_memory"
+    if new_messages(state):
+        return "hold_memory"
+    return END
+
+
 # Define the graph
-builder = StateGraph(MessagesState, config_schema=configuration.Configuration)
+builder = StateGraph(ExtractionState, config_schema=configuration.Configuration)
 builder.add_node("call_model", call_model)
 builder.add_node("write_memory", write_memory)
+builder.add_node("hold_memory", hold_memory)
 builder.add_edge(START, "call_model")
-builder.add_edge("call_model", "write_memory")
+builder.add_conditional_edges("call_model", route_extraction)
 builder.add_edge("write_memory", END)
+builder.add_edge("hold_memory", END)
 graph = builder.compile()
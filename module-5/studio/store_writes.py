@@ -0,0 +1,36 @@
+import logging
+import time
+import uuid
+
+from langgraph.store.base import BaseStore, PutOp
+
+logger = logging.getLogger(__name__)
+
+
+def response_puts(namespace: tuple, result: dict) -> list[PutOp]:
+    """One PutOp per Trustcall response, keyed by the patched doc's ID or a new one."""
+    return [
+        PutOp(
+            namespace,
+            rmeta.get("json_doc_id", str(uuid.uuid4())),
+            r.model_dump(mode="json"),
+        )
+        for r, rmeta in zip(result["responses"], result["response_metadata"])
+    ]
+
+
+def put_all(store: BaseStore, ops: list[PutOp]) -> None:
+    """Write all items in a single store.batch call, logging how long it took.
+
+    The Postgres store sends a batch as one pipelined round-trip, so an
+    extraction is written together instead of one network write per item.
+    """
+    if not ops:
+        return
+    # Later writes to the same item win, so the batch never upserts a row twice
+    ops = list({(op.namespace, op.key): op for op in ops}.values())
+    start = time.perf_counter()
+    store.batch(ops)
+    logger.info(
+        "Wrote %d items in %.1f ms", len(ops), (time.perf_counter() - start) * 1000
+    )
@@ -0,0 +1,42 @@
+import argparse
+import os
+import timeit
+
+from langchain_core.runnables.config import merge_configs
+from trustcall import create_extractor
+
+# The Gemini client needs an API key at import time; no requests are made
+os.environ.setdefault("GOOGLE_API_KEY", "offline")
+
+import task_maistro
+
+
+def build_uncached():
+    """Per-call construction, as update_todos used to do"""
+    extractor = create_extractor(
+        task_maistro.llm,
+        tools=[task_maistro.ToDo],
+        tool_choice="ToDo",
+        enable_inserts=True,
+    )
+    return extractor, merge_configs({}, {"callbacks": [task_maistro.ToolCallCapture()]})
+
+
+def build_pooled():
+    """Pooled extractor with a per-call tool call capture"""
+    extractor = task_maistro.get_extractor(
+        task_maistro.ToDo, tool_choice="ToDo", enable_inserts=True
+    )
+    return extractor, merge_configs({}, {"callbacks": [task_maistro.ToolCallCapture()]})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare Trustcall extractor construction with the extractor pool"
+    )
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    for name, build in [("create_extractor", build_uncached), ("pooled", build_pooled)]:
+        seconds = timeit.timeit(build, number=args.number)
+        print(f"{name:<18}{seconds / args.number * 1e6:>12.1f} us per call")
@@ -0,0 +1,53 @@
+import hashlib
+import math
+import re
+
+from langchain_core.messages import AnyMessage, get_buffer_string
+from langgraph.store.base import BaseStore, SearchItem
+
+# Dimensions of the hashed n-gram vectors; must match "dims" in langgraph.json
+DIMS = 256
+
+
+def _ngrams(text: str, n: int = 3):
+    """Character n-grams of each word, padded so short words still count"""
+    for word in re.findall(r"\w+", text.lower()):
+        padded = f" {word} "
+        for i in range(max(1, len(padded) - n + 1)):
+            yield padded[i : i + n]
+
+
+def embed_text(text: str) -> list[float]:
+    """Embed text as an L2-normalized vector of hashed character n-gram counts."""
+    vector = [0.0] * DIMS
+    for ngram in _ngrams(text):
+        digest = hashlib.blake2b(ngram.encode(), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % DIMS
+        # Use one hash bit as the sign to reduce the bias from collisions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    """Local, CPU-only embedding function for the store's semantic index."""
+    return [embed_text(text) for text in texts]
+
+
+def search_memories(
+    store: BaseStore, namespace: tuple, query: str, k: int, full_scan_threshold: int
+) -> list[SearchItem]:
+    """Return the k memories most relevant to the query.
+
+    Collections with at most full_scan_threshold items are returned whole, since
+    ranking them would not shrink the prompt much.
+    """
+    items = store.search(namespace, limit=full_scan_threshold + 1)
+    if len(items) <= full_scan_threshold:
+        return items
+    return store.search(namespace, query=query, limit=k)
+
+
+def recent_text(messages: list[AnyMessage], n: int = 4) -> str:
+    """Text of the last n messages, used as the retrieval query."""
+    return get_buffer_string(messages[-n:])
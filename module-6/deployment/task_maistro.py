@@ -1,40 +1,43 @@
-import uuid
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
 from pydantic import BaseModel, Field
 
 from trustcall import create_extractor
 
-from typing import Literal, Optional, TypedDict
+from typing import Annotated, Literal, Optional, TypedDict
 
-from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import merge_configs
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.messages import merge_message_runs
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import AIMessage, SystemMessage, HumanMessage
+from langchain_core.outputs import LLMResult
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.graph import StateGraph, MessagesState, START, END
-from langgraph.store.base import BaseStore
+from langgraph.store.base import BaseStore, GetOp, PutOp, SearchOp
 
 import configuration
+from memory_index import recent_text, search_memories
+from store_writes import put_all, response_puts
 
 ## Utilities
 
 
-# Inspect the tool calls for Trustcall
-class Spy:
+# Capture the tool calls made by Trustcall as its model calls finish
+class ToolCallCapture(BaseCallbackHandler):
     def __init__(self):
         self.called_tools = []
 
-    def __call__(self, run):
-        q = [run]
-        while q:
-            r = q.pop()
-            if r.child_runs:
-                q.extend(r.child_runs)
-            if r.run_type == "chat_model":
-                self.called_tools.append(
-                    r.outputs["generations"][0][0]["message"]["kwargs"]["tool_calls"]
-                )
+    def on_llm_end(self, response: LLMResult, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if isinstance(message, AIMessage):
+                    self.called_tools.append(message.tool_calls)
 
 
 # Extract information from tool calls for both patches and new memories in Trustcall
@@ -94,6 +97,160 @@ def extract_tool_info(tool_calls, schema_name="Memory"):
     return "\n\n".join(result_parts)
 
 
+# Per-thread read-through cache of the memories loaded by task_mAIstro.
+# Entries are dropped when this thread's update nodes write to the store, and
+# expire after MEMORY_CACHE_TTL seconds to pick up writes from other threads.
+MEMORY_CACHE_SIZE = 1024
+MEMORY_CACHE_TTL = 60
+memory_cache: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+memory_cache_lock = threading.Lock()  # Server worker threads share the cache
+
+
+def load_memories(store: BaseStore, config: RunnableConfig, todo_category, user_id):
+    """Load the profile, ToDo and instructions memories in one store round-trip."""
+    thread_id = config.get("configurable", {}).get("thread_id")
+    cache_key = (thread_id, todo_category, user_id)
+    with memory_cache_lock:
+        cached = memory_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < MEMORY_CACHE_TTL:
+            memory_cache.move_to_end(cache_key)
+            return cached[1]
+
+    # Batch the three namespace searches into a single call to the store
+    profile, todo, instructions = store.batch(
+        [
+            SearchOp(("profile", todo_category, user_id)),
+            GetOp(("todo_snapshot", todo_category, user_id), "snapshot"),
+            SearchOp(("instructions", todo_category, user_id)),
+        ]
+    )
+    if todo is None:
+        todo = rebuild_todo_snapshot(store, todo_category, user_id)
+    else:
+        todo = copy_todo_snapshot(todo.value)
+    memories = {"profile": profile, "todo": todo, "instructions": instructions}
+
+    if thread_id is not None:
+        with memory_cache_lock:
+            memory_cache[cache_key] = (time.monotonic(), memories)
+            memory_cache.move_to_end(cache_key)
+            if len(memory_cache) > MEMORY_CACHE_SIZE:
+                memory_cache.popitem(last=False)
+    return memories
+
+
+def invalidate_memories(config: RunnableConfig, todo_category, user_id):
+    """Drop this thread's cached memories after a write to the store."""
+    thread_id = config.get("configurable", {}).get("thread_id")
+    with memory_cache_lock:
+        memory_cache.pop((thread_id, todo_category, user_id), None)
+
+
+# Compact ToDo snapshot kept next to each user's ToDo namespace. It holds one
+# short line per task in creation order and is updated in place whenever
+# update_todos writes, so the prompt never re-serializes every ToDo item.
+TODO_SNAPSHOT_MAX_TOKENS = 2000
+CLOSED_STATUSES = ("done", "archived")
+
+
+def approximate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def todo_line(todo: dict) -> str:
+    """Format a ToDo item as a single compact line."""
+    parts = [todo["task"], todo.get("status", "not started")]
+    if todo.get("deadline"):
+        parts.append(f"due {todo['deadline']}")
+    if todo.get("time_to_complete"):
+        parts.append(f"{todo['time_to_complete']} min")
+    if todo.get("solutions"):
+        parts.append("solutions: " + "; ".join(todo["solutions"]))
+    return "- " + " | ".join(parts)
+
+
+def todo_entry(key: str, todo: dict) -> dict:
+    """Snapshot entry for a ToDo item; closed tasks keep no line."""
+    status = todo.get("status", "not started")
+    line = "" if status in CLOSED_STATUSES else todo_line(todo)
+    return {"key": key, "status": status, "line": line}
+
+
+def copy_todo_snapshot(snapshot: dict) -> dict:
+    """Copy a stored snapshot, since stores may return the stored value itself."""
+    return {"items": list(snapshot["items"]), "tokens": snapshot["tokens"]}
+
+
+def update_todo_snapshot(snapshot: dict, key: str, todo: dict) -> dict:
+    """Insert or replace one ToDo item in the snapshot, keeping its position."""
+    entry = todo_entry(key, todo)
+    line = entry["line"]
+    items = snapshot["items"]
+    for i, item in enumerate(items):
+        if item["key"] == key:
+            snapshot["tokens"] -= approximate_tokens(item["line"])
+            items[i] = entry
+            break
+    else:
+        items.append(entry)
+    snapshot["tokens"] += approximate_tokens(line)
+    return snapshot
+
+
+def rebuild_todo_snapshot(store: BaseStore, todo_category, user_id) -> dict:
+    """Build and save the snapshot from the full ToDo namespace, returning a copy."""
+    namespace = ("todo", todo_category, user_id)
+    todos, offset = [], 0
+    while page := store.search(namespace, limit=100, offset=offset):
+        todos.extend(page)
+        offset += len(page)
+    snapshot = {"items": [], "tokens": 0}
+    for item in sorted(todos, key=lambda item: item.created_at):
+        update_todo_snapshot(snapshot, item.key, item.value)
+    store.put(
+        ("todo_snapshot", todo_category, user_id), "snapshot", snapshot, index=False
+    )
+    return copy_todo_snapshot(snapshot)
+
+
+def todo_snapshot_matches(snapshot: dict, todos: list) -> bool:
+    """Whether the snapshot holds the current entry of every given ToDo item.
+
+    Concurrent writers can overwrite each other's snapshot updates, so a
+    snapshot that disagrees with items read from the store is rebuilt.
+    """
+    entries = {entry["key"]: entry for entry in snapshot["items"]}
+    return all(
+        entries.get(item.key) == todo_entry(item.key, item.value) for item in todos
+    )
+
+
+def render_todo_snapshot(snapshot: dict, max_tokens=TODO_SNAPSHOT_MAX_TOKENS) -> str:
+    """Render open tasks within the token budget and summarize the rest."""
+    lines, tokens, hidden = [], 0, 0
+    closed = dict.fromkeys(CLOSED_STATUSES, 0)
+    for item in snapshot["items"]:
+        if not item["line"]:
+            closed[item["status"]] += 1
+        elif tokens + approximate_tokens(item["line"]) <= max_tokens:
+            lines.append(item["line"])
+            tokens += approximate_tokens(item["line"])
+        else:
+            hidden += 1
+    if hidden:
+        lines.append(f"({hidden} more open tasks not shown)")
+    if any(closed.values()):
+        lines.append(
+            "("
+            + ", ".join(
+                f"{count} {status}" for status, count in closed.items() if count
+            )
+            + " tasks not shown)"
+        )
+    return "\n".join(lines)
+
+
 ## Schema definitions
 
 
@@ -146,12 +303,25 @@ class UpdateMemory(TypedDict):
 # Initialize the model
 llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
 
-## Create the Trustcall extractors for updating the user profile and ToDo list
-profile_extractor = create_extractor(
-    llm,
-    tools=[Profile],
-    tool_choice="Profile",
-)
+## Trustcall extractors for updating the user profile and ToDo list
+
+# Extractors are compiled once per (schema, tool_choice, enable_inserts) and
+# shared across calls; callbacks are passed per call in the invoke config
+extractor_pool: dict[tuple, Runnable] = {}
+
+
+def get_extractor(schema, tool_choice=None, enable_inserts=False) -> Runnable:
+    """Return the shared Trustcall extractor for a schema, creating it once."""
+    key = (schema, tool_choice, enable_inserts)
+    if key not in extractor_pool:
+        extractor_pool[key] = create_extractor(
+            llm,
+            tools=[schema],
+            tool_choice=tool_choice,
+            enable_inserts=enable_inserts,
+        )
+    return extractor_pool[key]
+
 
 ## Prompts
 
@@ -216,6 +386,38 @@ Your current instructions are:
 {current_instructions}
 </current_instructions>"""
 
+## Graph state
+
+
+# Reducer that merges the extraction marks of each memory type
+def merge_extracted(existing: dict, new: dict) -> dict:
+    return {**existing, **new}
+
+
+class State(MessagesState):
+    # Number of messages already passed to the extractor, per memory type
+    extracted: Annotated[dict[str, int], merge_extracted]
+
+
+def extraction_window(state: State, memory_type: str) -> list:
+    """Messages since the last extraction of a memory type, excluding the tool call.
+
+    The window opens on a user turn so it never starts with an orphaned tool
+    result, and always includes the latest user turn.
+    """
+    messages = state["messages"]
+    start = state.get("extracted", {}).get(memory_type, 0)
+    # Scan back from the message before the tool call, so the cost is
+    # proportional to the window, and slice only the window
+    window_start = None
+    for i in range(len(messages) - 2, -1, -1):
+        if i < start and window_start is not None:
+            break
+        if isinstance(messages[i], HumanMessage):
+            window_start = i
+    return messages[window_start or 0 : -1]
+
+
 ## Node definitions
 
 
@@ -228,24 +430,21 @@ def task_mAIstro(state: MessagesState, config: RunnableConfig, store: BaseStore)
     todo_category = configurable.todo_category
     task_maistro_role = configurable.task_maistro_role
 
-    # Retrieve profile memory from the store
-    namespace = ("profile", todo_category, user_id)
-    memories = store.search(namespace)
-    if memories:
-        user_profile = memories[0].value
+    # Retrieve profile, ToDo and custom instructions memories from the store
+    memories = load_memories(store, config, todo_category, user_id)
+
+    # Profile memory
+    if memories["profile"]:
+        user_profile = memories["profile"][0].value
     else:
         user_profile = None
 
-    # Retrieve people memory from the store
-    namespace = ("todo", todo_category, user_id)
-    memories = store.search(namespace)
-    todo = "\n".join(f"{mem.value}" for mem in memories)
+    # ToDo memory, from the compact snapshot
+    todo = render_todo_snapshot(memories["todo"])
 
-    # Retrieve custom instructions
-    namespace = ("instructions", todo_category, user_id)
-    memories = store.search(namespace)
-    if memories:
-        instructions = memories[0].value
+    # Custom instructions
+    if memories["instructions"]:
+        instructions = memories["instructions"][0].value
     else:
         instructions = ""
 
@@ -264,7 +463,7 @@ def task_mAIstro(state: MessagesState, config: RunnableConfig, store: BaseStore)
     return {"messages": [response]}
 
 
-def update_profile(state: MessagesState, config: RunnableConfig, store: BaseStore):
+def update_profile(state: State, config: RunnableConfig, store: BaseStore):
     """Reflect on the chat history and update the memory collection."""
 
     # Get the user ID from the config
@@ -289,29 +488,26 @@ def update_profile(state: MessagesState, config: RunnableConfig, store: BaseStor
         else None
     )
 
-    # Merge the chat history and the instruction
+    # Merge the messages since the last extraction and the instruction
     TRUSTCALL_INSTRUCTION_FORMATTED = TRUSTCALL_INSTRUCTION.format(
         time=datetime.now().isoformat()
     )
     updated_messages = list(
         merge_message_runs(
             messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)]
-            + state["messages"][:-1]
+            + extraction_window(state, "user")
         )
     )
 
     # Invoke the extractor
+    profile_extractor = get_extractor(Profile, tool_choice=tool_name)
     result = profile_extractor.invoke(
         {"messages": updated_messages, "existing": existing_memories}
     )
 
     # Save save the memories from Trustcall to the store
-    for r, rmeta in zip(result["responses"], result["response_metadata"]):
-        store.put(
-            namespace,
-            rmeta.get("json_doc_id", str(uuid.uuid4())),
-            r.model_dump(mode="json"),
-        )
+    put_all(store, response_puts(namespace, result))
+    invalidate_memories(config, todo_category, user_id)
     tool_calls = state["messages"][-1].tool_calls
     # Return tool message with update verification
     return {
@@ -321,11 +517,12 @@ def update_profile(state: MessagesState, config: RunnableConfig, store: BaseStor
                 "content": "updated profile",
                 "tool_call_id": tool_calls[0]["id"],
             }
-        ]
+        ],
+        "extracted": {"user": len(state["messages"])},
     }
 
 
-def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore):
+def update_todos(state: State, config: RunnableConfig, store: BaseStore):
     """Reflect on the chat history and update the memory collection."""
 
     # Get the user ID from the config
@@ -336,8 +533,18 @@ def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore)
     # Define the namespace for the memories
     namespace = ("todo", todo_category, user_id)
 
-    # Retrieve the most recent memories for context
-    existing_items = store.search(namespace)
+    # Messages since the last ToDo extraction
+    window = extraction_window(state, "todo")
+
+    # Retrieve the tasks most relevant to the conversation. Archived tasks stay
+    # in, so reopening one patches it rather than inserting a duplicate
+    existing_items = search_memories(
+        store,
+        namespace,
+        recent_text(window),
+        configurable.memory_top_k,
+        configurable.memory_full_scan_threshold,
+    )
 
     # Format the existing memories for the Trustcall extractor
     tool_name = "ToDo"
@@ -350,43 +557,53 @@ def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore)
         else None
     )
 
-    # Merge the chat history and the instruction
+    # Merge the messages since the last extraction and the instruction
     TRUSTCALL_INSTRUCTION_FORMATTED = TRUSTCALL_INSTRUCTION.format(
         time=datetime.now().isoformat()
     )
     updated_messages = list(
         merge_message_runs(
-            messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)]
-            + state["messages"][:-1]
+            messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)] + window
         )
     )
 
-    # Initialize the spy for visibility into the tool calls made by Trustcall
-    spy = Spy()
+    # Capture the tool calls made by Trustcall to report the changes
+    capture = ToolCallCapture()
 
-    # Create the Trustcall extractor for updating the ToDo list
-    todo_extractor = create_extractor(
-        llm, tools=[ToDo], tool_choice=tool_name, enable_inserts=True
-    ).with_listeners(on_end=spy)
+    # Get the Trustcall extractor for updating the ToDo list
+    todo_extractor = get_extractor(ToDo, tool_choice=tool_name, enable_inserts=True)
 
     # Invoke the extractor
     result = todo_extractor.invoke(
-        {"messages": updated_messages, "existing": existing_memories}
+        {"messages": updated_messages, "existing": existing_memories},
+        merge_configs(config, {"callbacks": [capture]}),
     )
 
     # Save save the memories from Trustcall to the store
-    for r, rmeta in zip(result["responses"], result["response_metadata"]):
-        store.put(
-            namespace,
-            rmeta.get("json_doc_id", str(uuid.uuid4())),
-            r.model_dump(mode="json"),
+    # Rebuild the snapshot if it is missing or has lost a concurrent update
+    snapshot_item = store.get(("todo_snapshot", todo_category, user_id), "snapshot")
+    if snapshot_item and todo_snapshot_matches(snapshot_item.value, existing_items):
+        snapshot = copy_todo_snapshot(snapshot_item.value)
+    else:
+        snapshot = rebuild_todo_snapshot(store, todo_category, user_id)
+    ops = response_puts(namespace, result)
+    for op in ops:
+        update_todo_snapshot(snapshot, op.key, op.value)
+
+    # Save the ToDo items and the updated snapshot together
+    ops.append(
+        PutOp(
+            ("todo_snapshot", todo_category, user_id), "snapshot", snapshot, index=False
         )
+    )
+    put_all(store, ops)
+    invalidate_memories(config, todo_category, user_id)
 
     # Respond to the tool call made in task_mAIstro, confirming the update
     tool_calls = state["messages"][-1].tool_calls
 
     # Extract the changes made by Trustcall and add the the ToolMessage returned to task_mAIstro
-    todo_update_msg = extract_tool_info(spy.called_tools, tool_name)
+    todo_update_msg = extract_tool_info(capture.called_tools, tool_name)
     return {
         "messages": [
             {
@@ -394,7 +611,8 @@ def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore)
                 "content": todo_update_msg,
                 "tool_call_id": tool_calls[0]["id"],
             }
-        ]
+        ],
+        "extracted": {"todo": len(state["messages"])},
     }
 
 
@@ -427,6 +645,7 @@ def update_instructions(state: MessagesState, config: RunnableConfig, store: Bas
     # Overwrite the existing memory in the store
     key = "user_instructions"
     store.put(namespace, key, {"memory": new_memory.content})
+    invalidate_memories(config, todo_category, user_id)
     tool_calls = state["messages"][-1].tool_calls
     # Return tool message with update verification
     return {
@@ -461,7 +680,7 @@ def route_message(
 
 
 # Create the graph + all nodes
-builder = StateGraph(MessagesState, config_schema=configuration.Configuration)
+builder = StateGraph(State, config_schema=configuration.Configuration)
 
 # Define the flow of the memory extraction process
 builder.add_node(task_mAIstro)